@@ -23,7 +23,8 @@ SETUPTOOLS_METADATA = dict(
         'Programming Language :: Python',
         'Framework :: Django',
     ],
-    packages=['socialregistration', 'socialregistration.templatetags'],
+    packages=['socialregistration', 'socialregistration.templatetags',
+        'socialregistration.management', 'socialregistration.management.commands'],
     package_data={'socialregistration': ['templates/socialregistration/*.html'], }
 )
 
@@ -1,8 +1,13 @@
+from __future__ import with_statement
+
+from django.core.cache import cache
 from django.contrib.auth.models import User
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.sites.models import Site
 
-from socialregistration.models import (FacebookProfile, TwitterProfile, OpenIDProfile)
+from socialregistration.models import (FacebookProfile, TwitterProfile, OpenIDProfile,
+    auth_cache_timeout)
+from socialregistration.metrics import timed
 
 class Auth(object):
     supports_object_permissions = False
@@ -18,18 +23,46 @@ class Auth(object):
         remote_id = kwargs.get(self.model.remote_id_field)
         if not remote_id or len(kwargs) != 1:
             return None
+
+        with timed('authenticate', self.network) as timer:
+            user = self._authenticate(remote_id, timer)
+        return user
+
+    def _authenticate(self, remote_id, timer):
+        timeout = auth_cache_timeout()
+        if timeout:
+            cache_key = self.model.get_auth_cache_key(remote_id)
+            user_id = cache.get(cache_key)
+            if user_id is not None:
+                user = self.get_user(user_id)
+                if user is not None:
+                    timer.outcome = 'cached'
+                    return user
+
+        # Resolve the user straight from the profile table in a subquery
+        # rather than going through the generic foreign key, which would
+        # need a second query.
+        profiles = self.model.objects.by_remote_id(remote_id).filter(
+            content_type=ContentType.objects.get_for_model(User),
+        )
         try:
-            return self.model.objects.by_remote_id(remote_id).filter(
-                content_type=ContentType.objects.get_for_model(User),
-            ).get().content_object
-        except self.model.DoesNotExist:
+            user = User.objects.get(pk__in=profiles.values('object_id'))
+        except User.DoesNotExist:
+            timer.outcome = 'not_found'
             return None
 
+        if timeout:
+            cache.set(cache_key, user.pk, timeout)
+        return user
+
 class FacebookAuth(Auth):
     model = FacebookProfile
+    network = 'facebook'
 
 class TwitterAuth(Auth):
     model = TwitterProfile
+    network = 'twitter'
 
 class OpenIDAuth(Auth):
     model = OpenIDProfile
+    network = 'openid'
@@ -0,0 +1,33 @@
+"""
+Cooperative provider I/O for gevent workers.
+
+Django has no asynchronous views, so the OAuth and OpenID views block while
+they wait on the provider. Under gevent every request runs in a greenlet
+and blocking socket calls switch to the other requests instead, which lets a
+single process hold many handshakes in flight. That only works as long as
+all provider I/O goes through sockets gevent has patched: httplib2 and
+oauth2 always do, python-openid only as long as it doesn't fetch with
+pycurl, which it prefers whenever pycurl is installed.
+
+Call ``patch`` once per process before the project is loaded, e.g. at the
+top of the WSGI module after ``DJANGO_SETTINGS_MODULE`` has been set::
+
+    from socialregistration import green
+    green.patch()
+"""
+
+def patch():
+    """
+    Patches the standard library with gevent, unless the server did so
+    already, and makes python-openid fetch through urllib2 if it would use
+    pycurl otherwise.
+    """
+    from gevent import monkey
+    if not monkey.is_module_patched('socket'):
+        monkey.patch_all()
+
+    from openid import fetchers
+    from socialregistration.utils import OpenIDFetcher
+    fetcher = fetchers.getDefaultFetcher()
+    if isinstance(getattr(fetcher, 'fetcher', fetcher), fetchers.CurlHTTPFetcher):
+        fetchers.setDefaultFetcher(OpenIDFetcher())
@@ -0,0 +1,23 @@
+from optparse import make_option
+
+from django.core.management.base import NoArgsCommand
+
+from socialregistration.utils import get_openid_store
+
+class Command(NoArgsCommand):
+    help = "Removes expired OpenID nonces and associations from the store."
+
+    option_list = NoArgsCommand.option_list + (
+        make_option('--batch-size', dest='batch_size', type='int', default=None,
+            help='Number of rows deleted per statement.'),
+    )
+
+    def handle_noargs(self, **options):
+        store = get_openid_store()
+        if options.get('batch_size'):
+            store.cleanup_batch_size = options['batch_size']
+
+        nonces, associations = store.cleanup()
+
+        if int(options.get('verbosity', 1)) > 0:
+            self.stdout.write("Removed %d expired nonces and %d expired associations.\n" % (nonces, associations))
@@ -23,5 +23,26 @@ class SocialProfileManager(models.Manager):
     def for_object(self, obj):
         return self.for_object_content_type(obj).get(object_id=obj.pk)
 
+    def for_object_in_request(self, request, obj):
+        """
+        Like ``for_object``, but remembers the profile, or that there is none,
+        on ``request`` so template tags used several times on a page only
+        fetch it once.
+        """
+        if request is None:
+            return self.for_object(obj)
+        profiles = getattr(request, '_socialregistration_profiles', None)
+        if profiles is None:
+            profiles = request._socialregistration_profiles = {}
+        key = (self.model, ContentType.objects.get_for_model(obj.__class__).pk, obj.pk)
+        if key not in profiles:
+            try:
+                profiles[key] = self.for_object(obj)
+            except self.model.DoesNotExist:
+                profiles[key] = None
+        if profiles[key] is None:
+            raise self.model.DoesNotExist
+        return profiles[key]
+
     def by_remote_id(self, identity):
-        return self.on_current_site().filter(**{self.model.remote_id_field: identity})
+        return self.on_current_site().filter(self.model.remote_id_lookup(identity))
@@ -0,0 +1,127 @@
+"""
+Timing of the phases of a social login: fetching tokens from the provider,
+OpenID discovery, authenticating against the profile tables, creating the
+user and the views themselves.
+
+Every phase sends ``socialregistration.signals.phase_finished``. If
+``SOCIALREGISTRATION_METRICS_BACKEND`` names a statsd-like class (anything
+with ``timing(stat, milliseconds)`` and ``incr(stat)``), durations and
+outcomes are also reported to it as
+``socialregistration.<site_id>.<network>.<phase>``.
+"""
+from __future__ import with_statement
+
+import threading
+import time
+
+from django.conf import settings
+from django.utils.functional import wraps
+from django.utils.importlib import import_module
+
+from socialregistration.signals import phase_finished
+
+class LocalMetrics(object):
+    """
+    In-process, statsd-like metrics keeping the count, total, minimum and
+    maximum of every timing and the value of every counter.
+    """
+    def __init__(self):
+        self.timings = {}
+        self.counters = {}
+        self._lock = threading.Lock()
+
+    def timing(self, stat, value):
+        self._lock.acquire()
+        try:
+            count, total, minimum, maximum = self.timings.get(stat, (0, 0, value, value))
+            self.timings[stat] = (count + 1, total + value, min(minimum, value), max(maximum, value))
+        finally:
+            self._lock.release()
+
+    def incr(self, stat, count=1):
+        self._lock.acquire()
+        try:
+            self.counters[stat] = self.counters.get(stat, 0) + count
+        finally:
+            self._lock.release()
+
+    def clear(self):
+        self._lock.acquire()
+        try:
+            self.timings.clear()
+            self.counters.clear()
+        finally:
+            self._lock.release()
+
+_backends = {}
+
+def get_metrics():
+    """
+    Returns the instance of ``SOCIALREGISTRATION_METRICS_BACKEND`` or ``None``
+    if no backend is configured. Instances are shared by the whole process.
+    """
+    path = getattr(settings, 'SOCIALREGISTRATION_METRICS_BACKEND', None)
+    if not path:
+        return None
+    if path not in _backends:
+        module, attr = path.rsplit('.', 1)
+        _backends[path] = getattr(import_module(module), attr)()
+    return _backends[path]
+
+def report_phase(sender, phase, network, site_id, duration, outcome, **kwargs):
+    metrics = get_metrics()
+    if metrics is None:
+        return
+    stat = 'socialregistration.%s.%s.%s' % (site_id, str(network).replace('.', '_'), phase)
+    metrics.timing(stat, duration)
+    metrics.incr('%s.%s' % (stat, outcome))
+
+phase_finished.connect(report_phase)
+
+
+class timed(object):
+    """
+    Times the enclosed block as ``phase`` of a login through ``network``::
+
+        with timed('access_token', 'twitter') as timer:
+            ...
+            timer.outcome = 'denied'
+
+    The outcome is ``'success'`` unless set otherwise, or the name of the
+    exception that left the block.
+    """
+    def __init__(self, phase, network):
+        self.phase = phase
+        self.network = network
+        self.outcome = 'success'
+
+    def __enter__(self):
+        self.start = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        duration = (time.time() - self.start) * 1000
+        if exc_type is not None:
+            self.outcome = exc_type.__name__
+        phase_finished.send(sender=self.__class__, phase=self.phase,
+            network=self.network, site_id=settings.SITE_ID,
+            duration=duration, outcome=self.outcome)
+        return False
+
+def timed_view(view, phase, network):
+    """
+    Wraps ``view`` to time it as ``phase``, with the response's status code
+    as the outcome. ``network`` may be a callable that gets the request and
+    the view's keyword arguments.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if callable(network):
+            name = network(request, kwargs)
+        else:
+            name = network
+        with timed(phase, name) as timer:
+            response = view(request, *args, **kwargs)
+            timer.outcome = str(response.status_code)
+        return response
+    return wrapper
@@ -1,5 +1,18 @@
+import hashlib
+import time
+
 import facebook
 from django.conf import settings
+from django.core.cache import cache
+from django.utils.encoding import smart_str
+from django.utils.functional import SimpleLazyObject
+
+from socialregistration.utils import LRUCache
+
+# Users parsed out of verified Facebook cookies, keyed by a digest of the
+# raw cookie value. ``cookie_cache.hits`` and ``cookie_cache.misses`` show how
+# many signature verifications were skipped.
+cookie_cache = LRUCache(getattr(settings, 'SOCIALREGISTRATION_FACEBOOK_COOKIE_CACHE_SIZE', 1000))
 
 class Facebook(object):
     def __init__(self, user=None):
@@ -11,6 +24,63 @@ class Facebook(object):
             self.graph = facebook.GraphAPI(user['access_token'])
 
 
+def get_user_from_cookie(cookies):
+    """
+    Memoizing wrapper around ``facebook.get_user_from_cookie``. A cookie that
+    verified once is trusted until it expires, so the signature isn't checked
+    again on every request of a browsing session.
+
+    Set ``SOCIALREGISTRATION_FACEBOOK_SHARED_COOKIE_CACHE`` to ``True`` to
+    share verified cookies between processes through Django's cache framework.
+    Cookies without an expiry are kept for
+    ``SOCIALREGISTRATION_FACEBOOK_COOKIE_CACHE_TIMEOUT`` seconds.
+    """
+    app_id = getattr(settings, 'FACEBOOK_API_KEY', '')
+    app_secret = getattr(settings, 'FACEBOOK_SECRET_KEY', '')
+
+    cookie = cookies.get('fbs_' + app_id, '')
+    if not cookie:
+        return facebook.get_user_from_cookie(cookies, app_id, app_secret)
+
+    key = 'socialregistration.facebook.cookie.%s' % hashlib.sha1(smart_str(cookie)).hexdigest()
+    use_shared_cache = getattr(settings, 'SOCIALREGISTRATION_FACEBOOK_SHARED_COOKIE_CACHE', False)
+
+    user = cookie_cache.get(key)
+    if user is not None:
+        return user
+
+    if use_shared_cache:
+        user = cache.get(key)
+    verified = user is None
+    if verified:
+        user = facebook.get_user_from_cookie(cookies, app_id, app_secret)
+        if user is None:
+            return None
+
+    timeout = _cookie_timeout(user)
+    if timeout > 0:
+        cookie_cache.set(key, user, timeout)
+        if use_shared_cache and verified:
+            cache.set(key, user, timeout)
+    return user
+
+def _cookie_timeout(user):
+    """
+    Returns for how many more seconds the cookie ``user`` was read from is valid.
+    """
+    expires = int(user.get('expires', 0) or 0)
+    if not expires:
+        return getattr(settings, 'SOCIALREGISTRATION_FACEBOOK_COOKIE_CACHE_TIMEOUT', 60 * 60)
+    return int(expires - time.time())
+
+def get_facebook(request):
+    """
+    Verifies the Facebook cookie of ``request`` and returns a ``Facebook``
+    object for it.
+    """
+    return Facebook(get_user_from_cookie(request.COOKIES))
+
+
 class FacebookMiddleware(object):
     def process_request(self, request):
         """
@@ -18,11 +88,15 @@ class FacebookMiddleware(object):
         once the user authenticated the  application and connected with facebook. 
         You might want to use this if you don't feel confortable with the 
         javascript library.
+
+        The cookie is only verified once ``request.facebook`` is accessed. 
+        Requests to paths starting with one of the prefixes in 
+        ``SOCIALREGISTRATION_FACEBOOK_IGNORE_PATHS`` never look at it at all.
         """
-        
-        fb_user = facebook.get_user_from_cookie(request.COOKIES,
-            getattr(settings, 'FACEBOOK_API_KEY', ''), getattr(settings, 'FACEBOOK_SECRET_KEY', ''))
+        ignore_paths = tuple(getattr(settings, 'SOCIALREGISTRATION_FACEBOOK_IGNORE_PATHS', ()))
+        if ignore_paths and request.path.startswith(ignore_paths):
+            request.facebook = Facebook()
+        else:
+            request.facebook = SimpleLazyObject(lambda: get_facebook(request))
 
-        request.facebook = Facebook(fb_user)
-        
-        return None
\ No newline at end of file
+        return None
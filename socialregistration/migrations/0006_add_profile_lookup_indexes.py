@@ -0,0 +1,97 @@
+# encoding: utf-8
+import datetime
+from south.db import db
+from south.v2 import SchemaMigration
+from django.db import models
+
+class Migration(SchemaMigration):
+
+    def forwards(self, orm):
+        # Adding index on 'FacebookProfile', fields ['uid', 'site', 'content_type']
+        db.create_index('socialregistration_facebookprofile', ['uid', 'site_id', 'content_type_id'])
+        # Adding index on 'FacebookProfile', fields ['site', 'content_type', 'object_id']
+        db.create_index('socialregistration_facebookprofile', ['site_id', 'content_type_id', 'object_id'])
+        # Adding index on 'TwitterProfile', fields ['twitter_id', 'site', 'content_type']
+        db.create_index('socialregistration_twitterprofile', ['twitter_id', 'site_id', 'content_type_id'])
+        # Adding index on 'TwitterProfile', fields ['site', 'content_type', 'object_id']
+        db.create_index('socialregistration_twitterprofile', ['site_id', 'content_type_id', 'object_id'])
+        # Adding index on 'OpenIDProfile', fields ['site', 'content_type', 'object_id']
+        db.create_index('socialregistration_openidprofile', ['site_id', 'content_type_id', 'object_id'])
+
+    def backwards(self, orm):
+        # Removing index on 'FacebookProfile', fields ['uid', 'site', 'content_type']
+        db.delete_index('socialregistration_facebookprofile', ['uid', 'site_id', 'content_type_id'])
+        # Removing index on 'FacebookProfile', fields ['site', 'content_type', 'object_id']
+        db.delete_index('socialregistration_facebookprofile', ['site_id', 'content_type_id', 'object_id'])
+        # Removing index on 'TwitterProfile', fields ['twitter_id', 'site', 'content_type']
+        db.delete_index('socialregistration_twitterprofile', ['twitter_id', 'site_id', 'content_type_id'])
+        # Removing index on 'TwitterProfile', fields ['site', 'content_type', 'object_id']
+        db.delete_index('socialregistration_twitterprofile', ['site_id', 'content_type_id', 'object_id'])
+        # Removing index on 'OpenIDProfile', fields ['site', 'content_type', 'object_id']
+        db.delete_index('socialregistration_openidprofile', ['site_id', 'content_type_id', 'object_id'])
+
+    models = {
+        'contenttypes.contenttype': {
+            'Meta': {'unique_together': "(('app_label', 'model'),)", 'object_name': 'ContentType', 'db_table': "'django_content_type'"},
+            'app_label': ('django.db.models.fields.CharField', [], {'max_length': '100'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'model': ('django.db.models.fields.CharField', [], {'max_length': '100'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '100'})
+        },
+        'sites.site': {
+            'Meta': {'object_name': 'Site', 'db_table': "'django_site'"},
+            'domain': ('django.db.models.fields.CharField', [], {'max_length': '100'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '50'})
+        },
+        'socialregistration.facebookprofile': {
+            'Meta': {'object_name': 'FacebookProfile'},
+            'consumer_key': ('django.db.models.fields.CharField', [], {'max_length': '128'}),
+            'consumer_secret': ('django.db.models.fields.CharField', [], {'max_length': '128'}),
+            'content_type': ('django.db.models.fields.related.ForeignKey', [], {'to': "orm['contenttypes.ContentType']"}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'object_id': ('django.db.models.fields.PositiveIntegerField', [], {}),
+            'site': ('django.db.models.fields.related.ForeignKey', [], {'to': "orm['sites.Site']"}),
+            'uid': ('django.db.models.fields.CharField', [], {'max_length': '255'})
+        },
+        'socialregistration.openidnonce': {
+            'Meta': {'object_name': 'OpenIDNonce'},
+            'date_created': ('django.db.models.fields.DateTimeField', [], {'auto_now_add': 'True', 'blank': 'True'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'salt': ('django.db.models.fields.CharField', [], {'max_length': '255'}),
+            'server_url': ('django.db.models.fields.CharField', [], {'max_length': '255'}),
+            'timestamp': ('django.db.models.fields.IntegerField', [], {})
+        },
+        'socialregistration.openidprofile': {
+            'Meta': {'object_name': 'OpenIDProfile'},
+            'content_type': ('django.db.models.fields.related.ForeignKey', [], {'to': "orm['contenttypes.ContentType']"}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'identity': ('django.db.models.fields.TextField', [], {}),
+            'object_id': ('django.db.models.fields.PositiveIntegerField', [], {}),
+            'site': ('django.db.models.fields.related.ForeignKey', [], {'to': "orm['sites.Site']"})
+        },
+        'socialregistration.openidstore': {
+            'Meta': {'object_name': 'OpenIDStore'},
+            'assoc_type': ('django.db.models.fields.TextField', [], {}),
+            'handle': ('django.db.models.fields.CharField', [], {'max_length': '255'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'issued': ('django.db.models.fields.IntegerField', [], {}),
+            'lifetime': ('django.db.models.fields.IntegerField', [], {}),
+            'secret': ('django.db.models.fields.TextField', [], {}),
+            'server_url': ('django.db.models.fields.CharField', [], {'max_length': '255'}),
+            'site': ('django.db.models.fields.related.ForeignKey', [], {'to': "orm['sites.Site']"})
+        },
+        'socialregistration.twitterprofile': {
+            'Meta': {'object_name': 'TwitterProfile'},
+            'consumer_key': ('django.db.models.fields.CharField', [], {'max_length': '128'}),
+            'consumer_secret': ('django.db.models.fields.CharField', [], {'max_length': '128'}),
+            'content_type': ('django.db.models.fields.related.ForeignKey', [], {'to': "orm['contenttypes.ContentType']"}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'object_id': ('django.db.models.fields.PositiveIntegerField', [], {}),
+            'screenname': ('django.db.models.fields.CharField', [], {'max_length': '40', 'null': 'True'}),
+            'site': ('django.db.models.fields.related.ForeignKey', [], {'to': "orm['sites.Site']"}),
+            'twitter_id': ('django.db.models.fields.PositiveIntegerField', [], {})
+        }
+    }
+
+    complete_apps = ['socialregistration']
@@ -1,14 +1,24 @@
-from django.db import models
+import hashlib
 
+from django.db import models, connection
+from django.db.models import Q
+from django.db.models.signals import post_init, post_save, post_delete
+
+from django.conf import settings
+from django.core.cache import cache
 from django.core.urlresolvers import reverse
 from django.contrib.auth import authenticate
 from django.contrib.auth.models import User
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.contenttypes import generic
 from django.contrib.sites.models import Site 
+from django.utils.encoding import smart_str
 
 from socialregistration.managers import SocialProfileManager
 
+# Bumped whenever the layout of the state records kept in the session changes
+SESSION_STATE_VERSION = 1
+
 class BaseSocialProfile(models.Model):
     object_id = models.PositiveIntegerField()
     content_type = models.ForeignKey(ContentType)
@@ -21,9 +31,50 @@ class BaseSocialProfile(models.Model):
     def remote_id(self):
         return getattr(self, self.remote_id_field)
 
+    @classmethod
+    def remote_id_lookup(cls, remote_id):
+        """
+        Returns the ``Q`` object used to find profiles by ``remote_id``.
+        """
+        return Q(**{cls.remote_id_field: remote_id})
+
+    @classmethod
+    def get_auth_cache_key(cls, remote_id, site_id=None):
+        """
+        Returns the cache key under which the authentication backends store
+        the user pk for ``remote_id`` on the given (or current) site.
+        """
+        if site_id is None:
+            site_id = Site.objects.get_current().pk
+        return 'socialregistration.auth.%s.%s.%s' % (cls._meta.module_name,
+            site_id, hashlib.sha1(smart_str(remote_id)).hexdigest())
+
     def authenticate(self):
         return authenticate(**{self.remote_id_field: self.remote_id})
 
+    def to_session_state(self):
+        """
+        Returns a small JSON serializable record of this unsaved profile to
+        keep in the session until the user finished the setup view.
+        """
+        return {
+            'v': SESSION_STATE_VERSION,
+            'network': ContentType.objects.get_for_model(self.__class__).pk,
+            'fields': dict((f.attname, getattr(self, f.attname)) for f in self._meta.fields
+                if f.editable and not f.primary_key and not f.rel and f.name != 'object_id'),
+        }
+
+    @staticmethod
+    def from_session_state(state):
+        """
+        Rebuilds the unsaved profile recorded by ``to_session_state``. Raises
+        ``ValueError`` for records of another version.
+        """
+        if state.get('v') != SESSION_STATE_VERSION:
+            raise ValueError('Unsupported session state version %r' % state.get('v'))
+        model = ContentType.objects.get_for_id(state['network']).model_class()
+        return model(**dict((str(name), value) for name, value in state['fields'].items()))
+
     def get_disconnect_url(self):
         return reverse('disconnect', kwargs={'network': ContentType.objects.get_for_model(self.__class__).pk, 'object_type': self.content_type.pk, 'object_id': self.object_id})
 
@@ -53,11 +104,33 @@ class TwitterProfile(BaseSocialProfile):
         return u'%s: %s' % (self.content_object, self.twitter_id)
 
 
+def hash_identity(identity):
+    """
+    Returns a fixed-width digest of an OpenID identity URL that, unlike the
+    identity itself, can be indexed.
+    """
+    return hashlib.sha1(smart_str(identity).strip()).hexdigest()
+
 class OpenIDProfile(BaseSocialProfile):
     identity = models.TextField()
+    identity_hash = models.CharField(max_length=40, editable=False, default='')
 
     remote_id_field = 'identity'
 
+    @classmethod
+    def remote_id_lookup(cls, remote_id):
+        # the digest narrows the lookup down through its index, the identity
+        # itself guards against collisions
+        lookup = Q(identity_hash=hash_identity(remote_id))
+        if getattr(settings, 'SOCIALREGISTRATION_OPENID_MATCH_UNHASHED', False):
+            # profiles migration 0008 hasn't filled in yet have an empty digest
+            lookup = lookup | Q(identity_hash='')
+        return lookup & Q(identity=remote_id)
+
+    def save(self, *args, **kwargs):
+        self.identity_hash = hash_identity(self.identity)
+        super(OpenIDProfile, self).save(*args, **kwargs)
+
     def __unicode__(self):
         return u'OpenID Profile for %s, via provider %s' % (self.content_object, self.identity)
 
@@ -69,6 +142,7 @@ class OpenIDStore(models.Model):
     secret = models.TextField()
     issued = models.IntegerField()
     lifetime = models.IntegerField()
+    expires_at = models.IntegerField(default=0)
     assoc_type = models.TextField()
 
     def __unicode__(self):
@@ -82,3 +156,87 @@ class OpenIDNonce(models.Model):
 
     def __unicode__(self):
         return u'OpenID Nonce for %s' % self.server_url
+
+    class Meta:
+        unique_together = (('server_url', 'timestamp', 'salt'),)
+
+
+# The profile models ``profiles_for_object`` looks up, by network
+PROFILE_MODELS = (
+    ('facebook', FacebookProfile),
+    ('twitter', TwitterProfile),
+    ('openid', OpenIDProfile),
+)
+
+def profiles_for_object(obj):
+    """
+    Returns a dictionary of the profiles ``obj`` has on the current site by
+    network, ``None`` for networks it isn't connected to. All networks are
+    fetched with a single ``UNION ALL`` query.
+    """
+    profiles = dict((network, None) for network, model in PROFILE_MODELS)
+    # anonymous users have no pk at all
+    if getattr(obj, 'pk', None) is None:
+        return profiles
+
+    qn = connection.ops.quote_name
+    # every column of every profile table, tables lacking one select NULL
+    columns = []
+    for network, model in PROFILE_MODELS:
+        for field in model._meta.fields:
+            if field.column not in columns:
+                columns.append(field.column)
+
+    selects, params = [], []
+    content_type = ContentType.objects.get_for_model(obj.__class__)
+    site = Site.objects.get_current()
+    for index, (network, model) in enumerate(PROFILE_MODELS):
+        own_columns = [field.column for field in model._meta.fields]
+        selects.append('SELECT %d, %s FROM %s WHERE %s = %%s AND %s = %%s AND %s = %%s' % (
+            index, ', '.join([column in own_columns and qn(column) or 'NULL' for column in columns]),
+            qn(model._meta.db_table), qn('content_type_id'), qn('object_id'), qn('site_id')))
+        params.extend([content_type.pk, obj.pk, site.pk])
+
+    cursor = connection.cursor()
+    cursor.execute(' UNION ALL '.join(selects), params)
+    for row in cursor.fetchall():
+        network, model = PROFILE_MODELS[row[0]]
+        values = dict(zip(columns, row[1:]))
+        profile = model(**dict((str(field.attname), values[field.column]) for field in model._meta.fields))
+        profile._state.adding = False
+        profile._state.db = connection.alias
+        profiles[network] = profile
+    return profiles
+
+def auth_cache_timeout():
+    """
+    Returns how long the authentication backends cache remote id lookups.
+    Caching is disabled unless ``SOCIALREGISTRATION_AUTH_CACHE_TIMEOUT`` is set.
+    """
+    return getattr(settings, 'SOCIALREGISTRATION_AUTH_CACHE_TIMEOUT', 0)
+
+def remember_auth_cache_key(sender, instance, **kwargs):
+    # The remote id and site the profile was loaded with. A save changing
+    # either leaves the cache key they map to behind, still pointing at the
+    # profile's user. Deferred fields are left alone so this never queries.
+    instance._auth_cache_state = (instance.__dict__.get(sender.remote_id_field),
+        instance.__dict__.get('site_id'))
+
+def invalidate_auth_cache(sender, instance, **kwargs):
+    if auth_cache_timeout():
+        keys = [sender.get_auth_cache_key(instance.remote_id, instance.site_id)]
+        remote_id, site_id = getattr(instance, '_auth_cache_state', (None, None))
+        if remote_id is not None and site_id is not None:
+            keys.append(sender.get_auth_cache_key(remote_id, site_id))
+        cache.delete_many(keys)
+    remember_auth_cache_key(sender, instance)
+
+post_init.connect(remember_auth_cache_key, sender=FacebookProfile)
+post_init.connect(remember_auth_cache_key, sender=TwitterProfile)
+post_init.connect(remember_auth_cache_key, sender=OpenIDProfile)
+post_save.connect(invalidate_auth_cache, sender=FacebookProfile)
+post_save.connect(invalidate_auth_cache, sender=TwitterProfile)
+post_save.connect(invalidate_auth_cache, sender=OpenIDProfile)
+post_delete.connect(invalidate_auth_cache, sender=FacebookProfile)
+post_delete.connect(invalidate_auth_cache, sender=TwitterProfile)
+post_delete.connect(invalidate_auth_cache, sender=OpenIDProfile)
@@ -0,0 +1,5 @@
+from django.dispatch import Signal
+
+# Sent when a phase of a social login finished, with its duration in
+# milliseconds and its outcome. See ``socialregistration.metrics``.
+phase_finished = Signal(providing_args=['phase', 'network', 'site_id', 'duration', 'outcome'])
@@ -67,7 +67,7 @@ class FacebookInfoNode(template.Node):
                 return ''
 
         try:
-            profile = FacebookProfile.objects.for_object(cobj)
+            profile = FacebookProfile.objects.for_object_in_request(context.get('request'), cobj)
             context[self.var_name] = profile
             return ''
         except FacebookProfile.DoesNotExist:
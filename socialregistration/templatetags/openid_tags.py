@@ -39,7 +39,7 @@ class OpenIDInfoNode(template.Node):
                 return ''
 
         try:
-            profile = OpenIDProfile.objects.for_object(cobj)
+            profile = OpenIDProfile.objects.for_object_in_request(context.get('request'), cobj)
             context[self.var_name] = profile
             return ''
         except OpenIDProfile.DoesNotExist:
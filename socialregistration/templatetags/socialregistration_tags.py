@@ -1,7 +1,9 @@
 import re
 from django import template
 from django.conf import settings
-from django.template import resolve_variable, Variable
+from django.template import resolve_variable, Variable, VariableDoesNotExist
+
+from socialregistration.models import profiles_for_object
 
 register = template.Library()
 
@@ -50,11 +52,12 @@ class OpenIDErrorsNode(template.Node):
         context['openid_error'] = request.session.get('openid_error', False)
         context['openid_provider'] = request.session.get('openid_provider', '')
 
-        # clear the error once it's been displayed once
-        if request.session.get('openid_error', False):
+        # clear the error once it's been displayed once, pages without an
+        # error leave the session untouched
+        if context['openid_error']:
             del request.session['openid_error']
-        if request.session.get('openid_provider', False):
-            del request.session['openid_provider']
+            if 'openid_provider' in request.session:
+                del request.session['openid_provider']
 
         return u''
 
@@ -93,3 +96,35 @@ def auth_enabled(parser, token):
         raise template.TemplateSyntaxError, "%r tag had invalid arguments" % tag_name
     network, var_name = m.groups()
     return AuthEnabledNode(network, var_name)
+
+
+class SocialProfilesNode(template.Node):
+    def __init__(self, obj, var_name):
+        self.obj = Variable(obj)
+        self.var_name = var_name
+
+    def render(self, context):
+        try:
+            obj = self.obj.resolve(context)
+        except VariableDoesNotExist:
+            obj = None
+        context[self.var_name] = profiles_for_object(obj)
+        return u''
+
+@register.tag
+def social_profiles(parser, token):
+    """
+    Usage: {% social_profiles for user as profiles %} Returns the object's
+    Facebook, Twitter and OpenID profiles as ``profiles.facebook``,
+    ``profiles.twitter`` and ``profiles.openid``, fetched with one query.
+    """
+    try:
+        tag_name, arg = token.contents.split(None, 1)
+    except ValueError:
+        raise template.TemplateSyntaxError, "%r tag requires arguments" % token.contents.split()[0]
+
+    m = re.search(r'for ([\w.]+) as (\w+)', arg)
+    if not m:
+        raise template.TemplateSyntaxError, "%r tag had invalid arguments" % tag_name
+    obj, var_name = m.groups()
+    return SocialProfilesNode(obj, var_name)
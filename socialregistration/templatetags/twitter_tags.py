@@ -63,7 +63,7 @@ class TwitterInfoNode(template.Node):
                 return ''
 
         try:
-            profile = TwitterProfile.objects.for_object(cobj)
+            profile = TwitterProfile.objects.for_object_in_request(context.get('request'), cobj)
             context[self.var_name] = profile
             return ''
         except TwitterProfile.DoesNotExist:
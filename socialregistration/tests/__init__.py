@@ -2,3 +2,9 @@ from socialregistration.tests.disconnection import *
 from socialregistration.tests.managers import *
 from socialregistration.tests.templatetags import *
 from socialregistration.tests.forms import *
+from socialregistration.tests.backends import *
+from socialregistration.tests.middleware import *
+from socialregistration.tests.utils import *
+from socialregistration.tests.views import *
+from socialregistration.tests.metrics import *
+from socialregistration.tests.queries import *
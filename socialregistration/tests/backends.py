@@ -0,0 +1,107 @@
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.contrib.sites.models import Site
+from django.core.cache import cache
+from django.test import TestCase
+from socialregistration.auth import FacebookAuth, TwitterAuth, OpenIDAuth
+from socialregistration.models import FacebookProfile, TwitterProfile, OpenIDProfile
+
+class SocialRegistrationAuthTests(TestCase):
+
+    def setUp(self):
+        # set up a site object in case the current site ID doesn't exist
+        site = Site.objects.get_or_create(pk=settings.SITE_ID)
+        self.user1 = User.objects.get_or_create(username='user1')[0]
+        # warm the site and content type caches so they don't skew query counts
+        Site.objects.get_current()
+        ContentType.objects.get_for_model(User)
+
+    def test_twitter_single_query(self):
+        TwitterProfile.objects.create(content_object=self.user1, twitter_id=1)
+        self.assertNumQueries(1, TwitterAuth().authenticate, twitter_id=1)
+        self.assertEqual(TwitterAuth().authenticate(twitter_id=1), self.user1)
+        self.assertEqual(TwitterAuth().authenticate(twitter_id=2), None)
+
+    def test_facebook_single_query(self):
+        FacebookProfile.objects.create(content_object=self.user1, uid='1')
+        self.assertNumQueries(1, FacebookAuth().authenticate, uid='1')
+        self.assertEqual(FacebookAuth().authenticate(uid='1'), self.user1)
+        self.assertEqual(FacebookAuth().authenticate(uid='2'), None)
+
+    def test_openid_single_query(self):
+        OpenIDProfile.objects.create(content_object=self.user1, identity='http://example.com/user1')
+        self.assertNumQueries(1, OpenIDAuth().authenticate, identity='http://example.com/user1')
+        self.assertEqual(OpenIDAuth().authenticate(identity='http://example.com/user1'), self.user1)
+        self.assertEqual(OpenIDAuth().authenticate(identity='http://example.com/user2'), None)
+
+    def test_ignores_other_objects(self):
+        # profiles tied to anything but a user can't be used to log in
+        TwitterProfile.objects.create(content_object=Site.objects.get_current(), twitter_id=1)
+        self.assertEqual(TwitterAuth().authenticate(twitter_id=1), None)
+
+class SocialRegistrationAuthCacheTests(TestCase):
+
+    def setUp(self):
+        # set up a site object in case the current site ID doesn't exist
+        site = Site.objects.get_or_create(pk=settings.SITE_ID)
+        self.user1 = User.objects.get_or_create(username='user1')[0]
+        self.user2 = User.objects.get_or_create(username='user2')[0]
+        # warm the site and content type caches so they don't skew query counts
+        Site.objects.get_current()
+        ContentType.objects.get_for_model(User)
+
+        self.pre_timeout = getattr(settings, 'SOCIALREGISTRATION_AUTH_CACHE_TIMEOUT', 0)
+        settings.SOCIALREGISTRATION_AUTH_CACHE_TIMEOUT = 60
+        cache.clear()
+
+    def tearDown(self):
+        settings.SOCIALREGISTRATION_AUTH_CACHE_TIMEOUT = self.pre_timeout
+        cache.clear()
+
+    def test_twitter_cached(self):
+        TwitterProfile.objects.create(content_object=self.user1, twitter_id=1)
+        self.assertEqual(TwitterAuth().authenticate(twitter_id=1), self.user1)
+        self.assertEqual(cache.get(TwitterProfile.get_auth_cache_key(1)), self.user1.pk)
+
+        # only the user is loaded on a cache hit
+        self.assertNumQueries(1, TwitterAuth().authenticate, twitter_id=1)
+
+    def test_facebook_invalidated_on_save(self):
+        fp1 = FacebookProfile.objects.create(content_object=self.user1, uid='1')
+        self.assertEqual(FacebookAuth().authenticate(uid='1'), self.user1)
+
+        fp1.content_object = self.user2
+        fp1.save()
+        self.assertEqual(cache.get(FacebookProfile.get_auth_cache_key('1')), None)
+        self.assertEqual(FacebookAuth().authenticate(uid='1'), self.user2)
+
+    def test_twitter_invalidated_on_remote_id_change(self):
+        tp1 = TwitterProfile.objects.create(content_object=self.user1, twitter_id=1)
+        self.assertEqual(TwitterAuth().authenticate(twitter_id=1), self.user1)
+
+        # the old id must not log in as user1 anymore
+        tp1 = TwitterProfile.objects.get(pk=tp1.pk)
+        tp1.twitter_id = 2
+        tp1.save()
+        self.assertEqual(cache.get(TwitterProfile.get_auth_cache_key(1)), None)
+        self.assertEqual(TwitterAuth().authenticate(twitter_id=1), None)
+        self.assertEqual(TwitterAuth().authenticate(twitter_id=2), self.user1)
+
+        # nor does the previous one after another change of the same instance
+        tp1.twitter_id = 3
+        tp1.save()
+        self.assertEqual(TwitterAuth().authenticate(twitter_id=2), None)
+
+    def test_openid_invalidated_on_delete(self):
+        op1 = OpenIDProfile.objects.create(content_object=self.user1, identity='http://example.com/user1')
+        self.assertEqual(OpenIDAuth().authenticate(identity='http://example.com/user1'), self.user1)
+
+        op1.delete()
+        self.assertEqual(OpenIDAuth().authenticate(identity='http://example.com/user1'), None)
+
+    def test_disabled(self):
+        settings.SOCIALREGISTRATION_AUTH_CACHE_TIMEOUT = 0
+        TwitterProfile.objects.create(content_object=self.user1, twitter_id=1)
+        self.assertEqual(TwitterAuth().authenticate(twitter_id=1), self.user1)
+        self.assertEqual(cache.get(TwitterProfile.get_auth_cache_key(1)), None)
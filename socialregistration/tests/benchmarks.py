@@ -0,0 +1,257 @@
+"""
+Benchmarks of the socialregistration login flows. Every flow runs through
+Django's test client against a throwaway test database of the configured
+project, with local stub providers standing in for Twitter, the OpenID
+provider and Facebook's cookie check::
+
+    DJANGO_SETTINGS_MODULE=settings python -m socialregistration.tests.benchmarks
+
+For every flow the latency percentiles of a whole run, its queries and the
+largest session it stored are reported. The micro-benchmarks after them
+time single views without the middleware and client around them. Logging is
+set to WARNING, like it usually is in production.
+"""
+import logging
+import sys
+import time
+
+import facebook
+from django.conf import settings
+from django.conf.urls.defaults import patterns, include
+from django.contrib.auth.models import User, AnonymousUser
+from django.core.urlresolvers import clear_url_caches
+from django.db import connection, reset_queries
+from django.test.client import Client, RequestFactory
+from django.test.utils import setup_test_environment
+from django.utils.importlib import import_module
+from socialregistration.middleware import Facebook, cookie_cache
+from socialregistration.models import FacebookProfile
+from socialregistration.tests import stubs as stub_providers
+from socialregistration.tests.stubs import (StubOAuthProvider, StubOpenIDProvider,
+    facebook_cookie)
+from socialregistration.utils import OAuthTwitter, http_pool
+from socialregistration.views import facebook_login, setup
+
+# Used as ROOT_URLCONF while the benchmarks run
+urlpatterns = patterns('',
+    (r'^social/', include('socialregistration.urls')),
+)
+
+class Browser(Client):
+    """
+    Test client that adds up the time and queries of its requests and keeps
+    track of the largest session they stored.
+    """
+    def __init__(self):
+        super(Browser, self).__init__()
+        self.elapsed = 0
+        self.queries = 0
+        self.session_bytes = 0
+
+    def visit(self, method, path, data={}, status=302):
+        start, queries = time.time(), len(connection.queries)
+        response = getattr(self, method)(path, data)
+        self.elapsed += time.time() - start
+        self.queries += len(connection.queries) - queries
+        if response.status_code != status:
+            raise AssertionError('%s %s answered %s instead of %s' % (
+                method.upper(), path, response.status_code, status))
+
+        key = self.cookies.get(settings.SESSION_COOKIE_NAME)
+        if key is not None:
+            store = import_module(settings.SESSION_ENGINE).SessionStore(key.value)
+            self.session_bytes = max(self.session_bytes, len(store.encode(store.load())))
+        return response
+
+    def setup(self, username):
+        self.visit('get', '/social/setup/', status=200)
+        self.visit('post', '/social/setup/', {'username': username, 'email': ''})
+
+def bench_twitter(stubs):
+    """
+    A new user signing up through Twitter.
+    """
+    def run(browser, i):
+        stubs['oauth'].user = {'id': i, 'screen_name': 'twitter%s' % i}
+        browser.visit('get', '/social/twitter/redirect/')
+        browser.visit('get', '/social/twitter/callback/', {'oauth_token': 'request'})
+        browser.visit('get', '/social/twitter/')
+        browser.setup('twitter%s' % i)
+    return run
+
+def bench_openid(stubs):
+    """
+    A new user signing up through an OpenID provider.
+    """
+    provider = stubs['openid']
+    def run(browser, i):
+        response = browser.visit('get', '/social/openid/redirect/', {'openid_provider': provider.url})
+        browser.visit('get', provider.assertion(response['Location'], '%s/user%s' % (provider.url, i)))
+        browser.setup('openid%s' % i)
+    return run
+
+def bench_facebook(stubs):
+    """
+    A new user signing up through Facebook.
+    """
+    def run(browser, i):
+        name, value = facebook_cookie(i, settings.FACEBOOK_API_KEY, settings.FACEBOOK_SECRET_KEY)
+        browser.cookies[name] = value
+        browser.visit('get', '/social/facebook/login/')
+        browser.setup('facebook%s' % i)
+    return run
+
+def bench_facebook_returning(stubs):
+    """
+    A returning Facebook user logging in.
+    """
+    user = User.objects.create(username='returning')
+    FacebookProfile.objects.create(content_object=user, uid='returning')
+    name, value = facebook_cookie('returning', settings.FACEBOOK_API_KEY, settings.FACEBOOK_SECRET_KEY)
+    def run(browser, i):
+        browser.cookies[name] = value
+        browser.visit('get', '/social/facebook/login/')
+    return run
+
+BENCHMARKS = (
+    ('twitter', bench_twitter),
+    ('openid', bench_openid),
+    ('facebook', bench_facebook),
+    ('facebook (returning)', bench_facebook_returning),
+)
+
+factory = RequestFactory()
+
+def request(method='get', path='/', data={}, session_data={}):
+    request = getattr(factory, method)(path, data)
+    request.session = import_module(settings.SESSION_ENGINE).SessionStore()
+    request.session.update(session_data)
+    request.user = AnonymousUser()
+    request.facebook = Facebook({'uid': '1234567890', 'access_token': 'aaaaaa'})
+    request._dont_enforce_csrf_checks = True
+    return request
+
+def micro_facebook_login():
+    """
+    The facebook_login view for a returning Facebook user.
+    """
+    user = User.objects.create(username='benchmark')
+    FacebookProfile.objects.create(content_object=user, uid='1234567890')
+    def run():
+        facebook_login(request())
+    return run
+
+def micro_setup_form():
+    """
+    The setup view showing a new Facebook user the form.
+    """
+    state = FacebookProfile(uid='0987654321').to_session_state()
+    def run():
+        setup(request(session_data={'socialregistration_profile': state}))
+    return run
+
+MICRO_BENCHMARKS = (
+    ('facebook_login', micro_facebook_login),
+    ('setup (form)', micro_setup_form),
+)
+
+def timed(func, iterations):
+    """
+    Returns the average duration of ``func`` in milliseconds.
+    """
+    func()
+    start = time.time()
+    for i in range(iterations):
+        func()
+    return (time.time() - start) * 1000 / iterations
+
+def percentile(samples, percent):
+    """
+    Returns the ``percent`` percentile of the sorted list ``samples``.
+    """
+    return samples[int(round(percent / 100.0 * (len(samples) - 1)))]
+
+def measure(run, iterations):
+    """
+    Runs the flow ``run`` with a fresh browser ``iterations`` times and
+    returns the sorted durations in milliseconds, the average queries and the
+    largest session in bytes.
+    """
+    durations, queries, session_bytes = [], 0, 0
+    # the first run warms caches and is left out
+    for i in range(1, iterations + 2):
+        browser = Browser()
+        reset_queries()
+        run(browser, i)
+        if i > 1:
+            durations.append(browser.elapsed * 1000)
+            queries += browser.queries
+            session_bytes = max(session_bytes, browser.session_bytes)
+    return sorted(durations), float(queries) / iterations, session_bytes
+
+def configure(stubs):
+    """
+    Points socialregistration at the stub providers.
+    """
+    oauth = stubs['oauth'].url
+    settings.ROOT_URLCONF = __name__
+    settings.TWITTER_CONSUMER_KEY = 'benchmark'
+    settings.TWITTER_CONSUMER_SECRET_KEY = 'benchmark'
+    settings.TWITTER_REQUEST_TOKEN_URL = '%s/request_token' % oauth
+    settings.TWITTER_ACCESS_TOKEN_URL = '%s/access_token' % oauth
+    settings.TWITTER_AUTHORIZATION_URL = '%s/authorize' % oauth
+    settings.FACEBOOK_API_KEY = 'benchmark'
+    settings.FACEBOOK_SECRET_KEY = 'benchmark'
+    settings.AUTHENTICATION_BACKENDS = (
+        'socialregistration.auth.TwitterAuth',
+        'socialregistration.auth.OpenIDAuth',
+        'socialregistration.auth.FacebookAuth',
+    )
+    settings.MIDDLEWARE_CLASSES = (
+        'django.contrib.sessions.middleware.SessionMiddleware',
+        'django.contrib.auth.middleware.AuthenticationMiddleware',
+        'django.contrib.messages.middleware.MessageMiddleware',
+        'socialregistration.middleware.FacebookMiddleware',
+    )
+    OAuthTwitter.url = '%s/account/verify_credentials.json' % oauth
+    # the installed facebook-sdk may be one exchanging codes with the Graph API
+    facebook.get_user_from_cookie = stub_providers.get_user_from_cookie
+    clear_url_caches()
+
+def main(iterations=100):
+    setup_test_environment()
+    logging.getLogger(getattr(settings, 'SOCIALREGISTRATION_LOGGER_NAME',
+        'socialregistration')).setLevel(logging.WARNING)
+    stubs = {'oauth': StubOAuthProvider().start(), 'openid': StubOpenIDProvider().start()}
+    get_user_from_cookie = facebook.get_user_from_cookie
+    configure(stubs)
+    old_name = settings.DATABASES['default']['NAME']
+    connection.creation.create_test_db(verbosity=0)
+    connection.use_debug_cursor = True
+    try:
+        sys.stdout.write('%-22s %9s %9s %9s %9s %9s\n' % (
+            'flow', 'p50 ms', 'p90 ms', 'p99 ms', 'queries', 'session'))
+        for name, benchmark in BENCHMARKS:
+            cookie_cache.clear()
+            try:
+                durations, queries, session_bytes = measure(benchmark(stubs), iterations)
+            except AssertionError, e:
+                sys.stdout.write('%-22s failed: %s\n' % (name, e))
+                continue
+            sys.stdout.write('%-22s %9.2f %9.2f %9.2f %9.1f %9d\n' % (name,
+                percentile(durations, 50), percentile(durations, 90),
+                percentile(durations, 99), queries, session_bytes))
+
+        sys.stdout.write('\n%-22s %9s\n' % ('view', 'avg ms'))
+        for name, benchmark in MICRO_BENCHMARKS:
+            sys.stdout.write('%-22s %9.3f\n' % (name, timed(benchmark(), iterations)))
+    finally:
+        facebook.get_user_from_cookie = get_user_from_cookie
+        connection.use_debug_cursor = False
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        http_pool.clear()
+        for stub in stubs.values():
+            stub.stop()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+"""
+Load test comparing the throughput of the OAuth and OpenID handshakes in a
+sync worker with a gevent worker set up by ``socialregistration.green``.
+Both run the same views through Django's test client against local stub
+providers answering every request after ``delay`` seconds, each in a
+process of its own::
+
+    DJANGO_SETTINGS_MODULE=settings python -m socialregistration.tests.load
+
+The sync worker serves one handshake at a time, the gevent worker up to
+``concurrency``. Sessions and OpenID nonces are kept in the cache so
+SQLite's single writer doesn't limit the gevent worker.
+"""
+# Nothing else may be imported at module level, the gevent worker patches
+# the standard library before Django is loaded.
+import subprocess
+import sys
+import time
+
+def twitter_handshake(browser, stubs):
+    """
+    Twitter redirect, callback and login of a user without an account yet.
+    """
+    browser.visit('get', '/social/twitter/redirect/')
+    browser.visit('get', '/social/twitter/callback/', {'oauth_token': 'request'})
+    browser.visit('get', '/social/twitter/')
+
+def openid_handshake(browser, stubs):
+    """
+    OpenID redirect and callback of a user without an account yet.
+    """
+    provider = stubs['openid']
+    response = browser.visit('get', '/social/openid/redirect/', {'openid_provider': provider.url})
+    browser.visit('get', provider.assertion(response['Location'], '%s/alice' % provider.url))
+
+HANDSHAKES = (
+    ('twitter', twitter_handshake),
+    ('openid', openid_handshake),
+)
+
+def run(mode, count, concurrency, delay):
+    """
+    Runs ``count`` handshakes of every kind in a ``mode`` worker and writes
+    their throughput and latency percentiles to stdout.
+    """
+    if mode == 'gevent':
+        from socialregistration import green
+        green.patch()
+
+    import tempfile
+    from django.conf import settings
+    from django.db import connection
+    from django.test.utils import setup_test_environment
+    from socialregistration.tests.benchmarks import Browser, configure, percentile
+    from socialregistration.tests.stubs import StubOAuthProvider, StubOpenIDProvider
+    from socialregistration.utils import http_pool
+
+    setup_test_environment()
+    stubs = {'oauth': StubOAuthProvider(), 'openid': StubOpenIDProvider()}
+    for stub in stubs.values():
+        stub.delay = delay
+        stub.start()
+    configure(stubs)
+    settings.SESSION_ENGINE = 'django.contrib.sessions.backends.cache'
+    settings.SOCIALREGISTRATION_OPENID_STORE = 'socialregistration.utils.CacheOpenIDStore'
+    old_name = settings.DATABASES['default']['NAME']
+    if settings.DATABASES['default']['ENGINE'].endswith('sqlite3'):
+        # every greenlet has a connection of its own, they can't share :memory:
+        settings.DATABASES['default']['TEST_NAME'] = tempfile.mktemp(suffix='.db')
+    connection.creation.create_test_db(verbosity=0)
+
+    def handshake(flow):
+        browser = Browser()
+        start = time.time()
+        flow(browser, stubs)
+        return (time.time() - start) * 1000
+
+    try:
+        for name, flow in HANDSHAKES:
+            # warms the content type, site and discovery caches
+            handshake(flow)
+            start = time.time()
+            if mode == 'gevent':
+                from gevent.pool import Pool
+                durations = Pool(concurrency).map(handshake, [flow] * count)
+            else:
+                durations = [handshake(flow) for i in range(count)]
+            elapsed = time.time() - start
+            durations.sort()
+            sys.stdout.write('%-8s %-8s %12.1f %9.2f %9.2f\n' % (mode, name, count / elapsed,
+                percentile(durations, 50), percentile(durations, 90)))
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        http_pool.clear()
+        for stub in stubs.values():
+            stub.stop()
+
+def main(count=100, concurrency=50, delay=0.05):
+    sys.stdout.write('%-8s %-8s %12s %9s %9s\n' % ('worker', 'flow', 'handshakes/s', 'p50 ms', 'p90 ms'))
+    sys.stdout.flush()
+    for mode in ('sync', 'gevent'):
+        process = subprocess.Popen([sys.executable, '-m', 'socialregistration.tests.load', mode,
+            str(count), str(concurrency), str(delay)], stderr=subprocess.PIPE)
+        errors = process.communicate()[1]
+        if process.returncode:
+            sys.stdout.write('%-8s failed: %s\n' % (mode, errors.strip().splitlines()[-1]))
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        run(sys.argv[1], int(sys.argv[2]), int(sys.argv[3]), float(sys.argv[4]))
+    else:
+        main()
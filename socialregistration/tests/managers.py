@@ -4,7 +4,8 @@ from django.contrib.auth.models import User
 from django.contrib.sites.models import Site
 from django.http import HttpRequest
 from django.test import TestCase
-from socialregistration.models import FacebookProfile, TwitterProfile, OpenIDProfile
+from socialregistration.auth import OpenIDAuth
+from socialregistration.models import FacebookProfile, TwitterProfile, OpenIDProfile, hash_identity
 
 class MockUser(object):
     auth = False
@@ -206,3 +207,31 @@ class SocialRegistrationManagerTests(TestCase):
         op1 = OpenIDProfile.objects.create(content_object=self.user1)
         self.assertEqual(OpenIDProfile.objects.for_object_content_type(self.user1).count(), 1)
         op1.delete()
+
+    def test_openid_by_remote_id(self):
+        self.assertEqual(OpenIDProfile.objects.by_remote_id('http://example.com/user1').count(), 0)
+        op1 = OpenIDProfile.objects.create(content_object=self.user1, identity='http://example.com/user1')
+        self.assertEqual(op1.identity_hash, hash_identity('http://example.com/user1'))
+        self.assertEqual(OpenIDProfile.objects.by_remote_id('http://example.com/user1').get(), op1)
+
+        # the digest follows the identity when it changes
+        op1.identity = 'http://example.com/user2'
+        op1.save()
+        self.assertEqual(OpenIDProfile.objects.by_remote_id('http://example.com/user1').count(), 0)
+        self.assertEqual(OpenIDProfile.objects.by_remote_id('http://example.com/user2').get(), op1)
+        op1.delete()
+
+    def test_openid_by_remote_id_not_backfilled(self):
+        op1 = OpenIDProfile.objects.create(content_object=self.user1, identity='http://example.com/user1')
+        # like a profile migration 0008 hasn't got to yet
+        OpenIDProfile.objects.filter(pk=op1.pk).update(identity_hash='')
+        self.assertEqual(OpenIDProfile.objects.by_remote_id('http://example.com/user1').count(), 0)
+
+        settings.SOCIALREGISTRATION_OPENID_MATCH_UNHASHED = True
+        try:
+            self.assertEqual(OpenIDProfile.objects.by_remote_id('http://example.com/user1').get(), op1)
+            self.assertEqual(OpenIDProfile.objects.by_remote_id('http://example.com/user2').count(), 0)
+            self.assertEqual(OpenIDAuth().authenticate(identity='http://example.com/user1'), self.user1)
+        finally:
+            del settings.SOCIALREGISTRATION_OPENID_MATCH_UNHASHED
+        op1.delete()
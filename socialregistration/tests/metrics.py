@@ -0,0 +1,112 @@
+from __future__ import with_statement
+
+from django.conf import settings
+from django.contrib.auth.models import User, AnonymousUser
+from django.contrib.sites.models import Site
+from django.test import TestCase
+from django.test.client import RequestFactory
+from django.utils.importlib import import_module
+from socialregistration.auth import FacebookAuth
+from socialregistration.metrics import LocalMetrics, get_metrics, timed, _backends
+from socialregistration.middleware import Facebook
+from socialregistration.models import FacebookProfile, TwitterProfile
+from socialregistration.signals import phase_finished
+from socialregistration.utils import get_network
+from socialregistration.views import facebook_login, setup
+
+class SocialRegistrationMetricsTests(TestCase):
+
+    def setUp(self):
+        # set up a site object in case the current site ID doesn't exist
+        site = Site.objects.get_or_create(pk=settings.SITE_ID)
+        self.phases = []
+        phase_finished.connect(self.record)
+        self.pre_backend = getattr(settings, 'SOCIALREGISTRATION_METRICS_BACKEND', None)
+        settings.SOCIALREGISTRATION_METRICS_BACKEND = 'socialregistration.metrics.LocalMetrics'
+        _backends.clear()
+
+    def tearDown(self):
+        phase_finished.disconnect(self.record)
+        settings.SOCIALREGISTRATION_METRICS_BACKEND = self.pre_backend
+        _backends.clear()
+
+    def record(self, sender, **kwargs):
+        self.phases.append((kwargs['phase'], kwargs['network'], kwargs['outcome']))
+
+    def test_local_metrics(self):
+        metrics = LocalMetrics()
+        metrics.timing('a', 5)
+        metrics.timing('a', 1)
+        metrics.incr('a.success')
+        metrics.incr('a.success')
+        self.assertEqual(metrics.timings['a'], (2, 6, 1, 5))
+        self.assertEqual(metrics.counters['a.success'], 2)
+        metrics.clear()
+        self.assertEqual(metrics.timings, {})
+
+    def test_timed(self):
+        with timed('access_token', 'api.twitter.com') as timer:
+            timer.outcome = 'denied'
+        try:
+            with timed('access_token', 'api.twitter.com'):
+                raise KeyError('oauth_token')
+        except KeyError:
+            pass
+        self.assertEqual(self.phases, [
+            ('access_token', 'api.twitter.com', 'denied'),
+            ('access_token', 'api.twitter.com', 'KeyError'),
+        ])
+
+        metrics = get_metrics()
+        stat = 'socialregistration.%s.api_twitter_com.access_token' % settings.SITE_ID
+        self.assertEqual(metrics.timings[stat][0], 2)
+        self.assertEqual(metrics.counters['%s.denied' % stat], 1)
+        self.assertEqual(metrics.counters['%s.KeyError' % stat], 1)
+
+    def test_disabled(self):
+        settings.SOCIALREGISTRATION_METRICS_BACKEND = None
+        with timed('authenticate', 'facebook'):
+            pass
+        self.assertEqual(get_metrics(), None)
+        # the signal is sent regardless
+        self.assertEqual(self.phases, [('authenticate', 'facebook', 'success')])
+
+    def test_get_network(self):
+        request_token_url = getattr(settings, 'TWITTER_REQUEST_TOKEN_URL', '')
+        settings.TWITTER_REQUEST_TOKEN_URL = 'https://api.twitter.com/oauth/request_token'
+        try:
+            self.assertEqual(get_network('https://api.twitter.com/oauth/access_token'), 'twitter')
+            self.assertEqual(get_network('https://example.com/oauth/request_token'), 'example.com')
+            self.assertEqual(get_network(''), '')
+        finally:
+            settings.TWITTER_REQUEST_TOKEN_URL = request_token_url
+
+    def test_setup(self):
+        request = RequestFactory().get('/')
+        request.session = import_module(settings.SESSION_ENGINE).SessionStore()
+        request.user = AnonymousUser()
+        setup(request)
+        request.session['socialregistration_profile'] = TwitterProfile(twitter_id=1).to_session_state()
+        setup(request)
+        self.assertEqual(self.phases, [
+            ('setup', 'social', '200'),
+            ('setup', 'twitter', '200'),
+        ])
+
+    def test_facebook_login(self):
+        user = User.objects.create(username='alice')
+        FacebookProfile.objects.create(content_object=user, uid='1234567890')
+        self.assertEqual(FacebookAuth().authenticate(uid='0987654321'), None)
+
+        request = RequestFactory().get('/')
+        request.session = import_module(settings.SESSION_ENGINE).SessionStore()
+        request.user = AnonymousUser()
+        request.facebook = Facebook({'uid': '1234567890', 'access_token': 'aaaaaa'})
+        response = facebook_login(request)
+        self.assertEqual(response.status_code, 302)
+
+        self.assertEqual(self.phases, [
+            ('authenticate', 'facebook', 'not_found'),
+            ('authenticate', 'facebook', 'success'),
+            ('login', 'facebook', '302'),
+        ])
@@ -0,0 +1,66 @@
+import time
+
+import facebook
+from django.conf import settings
+from django.http import HttpRequest
+from django.test import TestCase
+from socialregistration.middleware import FacebookMiddleware, cookie_cache
+
+class SocialRegistrationFacebookMiddlewareTests(TestCase):
+
+    def setUp(self):
+        self.calls = []
+        self.get_user_from_cookie = facebook.get_user_from_cookie
+        facebook.get_user_from_cookie = self.fake_get_user_from_cookie
+        self.pre_ignore = getattr(settings, 'SOCIALREGISTRATION_FACEBOOK_IGNORE_PATHS', ())
+        self.expires = int(time.time()) + 3600
+        cookie_cache.clear()
+
+    def tearDown(self):
+        facebook.get_user_from_cookie = self.get_user_from_cookie
+        settings.SOCIALREGISTRATION_FACEBOOK_IGNORE_PATHS = self.pre_ignore
+
+    def fake_get_user_from_cookie(self, cookies, app_id, app_secret):
+        self.calls.append(cookies)
+        return {'uid': '1234567890', 'access_token': 'aaaaaa', 'expires': self.expires}
+
+    def request(self, path='/', cookie='access_token=aaaaaa&sig=bbbbbb'):
+        request = HttpRequest()
+        request.path = path
+        request.COOKIES['fbs_%s' % getattr(settings, 'FACEBOOK_API_KEY', '')] = cookie
+        FacebookMiddleware().process_request(request)
+        return request
+
+    def test_lazy(self):
+        request = self.request()
+        self.assertEqual(self.calls, [])
+
+        self.assertEqual(request.facebook.uid, '1234567890')
+        self.assertEqual(request.facebook.user['access_token'], 'aaaaaa')
+        self.assertEqual(len(self.calls), 1)
+
+    def test_ignore_paths(self):
+        settings.SOCIALREGISTRATION_FACEBOOK_IGNORE_PATHS = ('/api/', '/static/')
+
+        request = self.request('/api/items/')
+        self.assertEqual(request.facebook.uid, None)
+        self.assertEqual(self.calls, [])
+
+        request = self.request('/items/')
+        self.assertEqual(request.facebook.uid, '1234567890')
+
+    def test_cookie_cache(self):
+        self.assertEqual(self.request().facebook.uid, '1234567890')
+        self.assertEqual(self.request().facebook.uid, '1234567890')
+        self.assertEqual(len(self.calls), 1)
+        self.assertEqual((cookie_cache.hits, cookie_cache.misses), (1, 1))
+
+        # a different cookie is verified again
+        self.assertEqual(self.request(cookie='access_token=cccccc&sig=dddddd').facebook.uid, '1234567890')
+        self.assertEqual(len(self.calls), 2)
+
+    def test_cookie_cache_expired(self):
+        self.expires = int(time.time()) - 1
+        self.assertEqual(self.request().facebook.uid, '1234567890')
+        self.assertEqual(self.request().facebook.uid, '1234567890')
+        self.assertEqual(len(self.calls), 2)
@@ -0,0 +1,310 @@
+"""
+Query budgets of the views and template tags. Each branch may run at most the
+number of queries it is pinned to here; raise a budget only deliberately.
+The site and content type caches are warm, like on a live site.
+"""
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.contrib.sites.models import Site
+from django.core.urlresolvers import reverse
+from django.db import connection
+from django.template import Template, Context
+from socialregistration.models import FacebookProfile, TwitterProfile, OpenIDProfile
+from socialregistration.tests.stubs import StubOAuthProvider, StubOpenIDProvider
+from socialregistration.tests.views import SocialRegistrationViewTests
+from socialregistration.utils import OAuthTwitter, get_token_prefix, http_pool
+from socialregistration.views import (setup, facebook_login, facebook_connect, logout,
+    twitter, oauth_redirect, oauth_callback, openid_redirect, openid_callback, disconnect,
+    get_object_reference)
+
+class SocialRegistrationQueryBudgetTests(SocialRegistrationViewTests):
+
+    def setUp(self):
+        super(SocialRegistrationQueryBudgetTests, self).setUp()
+        self.site = Site.objects.get_current()
+        for model in (User, Site, FacebookProfile, TwitterProfile, OpenIDProfile):
+            ContentType.objects.get_for_model(model)
+        ContentType.objects.get_by_natural_key('sites', 'site')
+        self.user = User.objects.create(username='alice')
+
+    def assertQueries(self, budget, func, *args, **kwargs):
+        """
+        Runs ``func`` and fails if it ran more than ``budget`` queries.
+        """
+        connection.use_debug_cursor = True
+        start = len(connection.queries)
+        try:
+            result = func(*args, **kwargs)
+        finally:
+            connection.use_debug_cursor = False
+        queries = [query['sql'] for query in connection.queries[start:]]
+        self.assertTrue(len(queries) <= budget, '%s ran %d queries, its budget is %d:\n%s' % (
+            func.__name__, len(queries), budget, '\n'.join(queries)))
+        return result
+
+    def login_request(self, method='get', path='/', data={}):
+        request = self.request(method, path, data)
+        request.user = self.user
+        return request
+
+    def connect(self):
+        self.session['socialregistration_connect_object'] = get_object_reference(
+            {'a': 'sites', 'm': 'site', 'i': str(self.site.pk)})
+
+    def deactivate(self):
+        self.user.is_active = False
+        self.user.save()
+
+    def assertRedirect(self, response, url):
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response['Location'], url)
+
+    def assertSetup(self, response, request):
+        """
+        The new user branch: sent to the setup view, not logged in.
+        """
+        self.assertRedirect(response, reverse('socialregistration_setup'))
+        self.assertFalse(request.user.is_authenticated())
+        self.assertTrue('socialregistration_profile' in self.session)
+
+    def assertLoggedIn(self, response, request, user=None):
+        user = user or self.user
+        self.assertRedirect(response, settings.LOGIN_REDIRECT_URL)
+        self.assertEqual(request.user, user)
+        self.assertEqual(self.session['_auth_user_id'], user.pk)
+
+    def assertInactive(self, response, request):
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(request.user.is_authenticated())
+
+    def assertConnected(self, response, model, obj):
+        self.assertRedirect(response, settings.LOGIN_REDIRECT_URL)
+        self.assertEqual(model.objects.filter(object_id=obj.pk,
+            content_type=ContentType.objects.get_for_model(obj)).count(), 1)
+        self.assertFalse('socialregistration_connect_object' in self.session)
+
+class SocialRegistrationViewQueryBudgetTests(SocialRegistrationQueryBudgetTests):
+
+    def test_setup(self):
+        response = self.assertQueries(0, setup, self.request())
+        self.assertEqual(response.status_code, 200)
+
+        self.session['socialregistration_profile'] = FacebookProfile(uid='1234567890').to_session_state()
+        response = self.assertQueries(1, setup, self.request())
+        self.assertEqual(response.status_code, 200)
+
+        request = self.request('post', data={'username': 'bob', 'email': ''})
+        response = self.assertQueries(14, setup, request)
+        self.assertLoggedIn(response, request, User.objects.get(username='bob'))
+        self.assertEqual(FacebookProfile.objects.get(uid='1234567890').content_object, request.user)
+
+    def test_setup_existing_profile(self):
+        FacebookProfile.objects.create(content_object=self.user, uid='1234567890')
+        self.session['socialregistration_profile'] = FacebookProfile(uid='1234567890').to_session_state()
+        request = self.request()
+        self.assertLoggedIn(self.assertQueries(10, setup, request), request)
+
+    def test_facebook_login(self):
+        # new user
+        request = self.request()
+        self.assertSetup(self.assertQueries(1, facebook_login, request), request)
+
+        FacebookProfile.objects.create(content_object=self.user, uid='1234567890')
+        request = self.request()
+        self.assertLoggedIn(self.assertQueries(7, facebook_login, request), request)
+
+        self.deactivate()
+        request = self.request()
+        self.assertInactive(self.assertQueries(1, facebook_login, request), request)
+
+    def test_facebook_connect(self):
+        # creates the profile of the logged in user, then updates it
+        response = self.assertQueries(2, facebook_connect, self.login_request())
+        self.assertConnected(response, FacebookProfile, self.user)
+        response = self.assertQueries(3, facebook_connect, self.login_request())
+        self.assertConnected(response, FacebookProfile, self.user)
+
+        data = {'a': 'sites', 'm': 'site', 'i': str(self.site.pk)}
+        response = self.assertQueries(3, facebook_connect, self.login_request(data=data))
+        self.assertConnected(response, FacebookProfile, self.site)
+        response = self.assertQueries(4, facebook_connect, self.login_request(data=data))
+        self.assertConnected(response, FacebookProfile, self.site)
+
+    def test_logout(self):
+        request = self.login_request()
+        response = self.assertQueries(2, logout, request)
+        self.assertRedirect(response, '/')
+        self.assertFalse(request.user.is_authenticated())
+
+    def test_disconnect(self):
+        profile = FacebookProfile.objects.create(content_object=self.user, uid='1234567890')
+        args = (ContentType.objects.get_for_model(FacebookProfile).pk,
+            ContentType.objects.get_for_model(User).pk, self.user.pk)
+        response = self.assertQueries(4, disconnect, self.login_request(), *args)
+        self.assertEqual(response.status_code, 200)
+        response = self.assertQueries(5, disconnect, self.login_request('post'), *args)
+        self.assertRedirect(response, self.user.get_absolute_url())
+        self.assertFalse(FacebookProfile.objects.filter(pk=profile.pk).exists())
+
+class SocialRegistrationOAuthQueryBudgetTests(SocialRegistrationQueryBudgetTests):
+
+    def setUp(self):
+        super(SocialRegistrationOAuthQueryBudgetTests, self).setUp()
+        self.provider = StubOAuthProvider().start()
+        self.settings = dict((name, getattr(settings, name, '')) for name in (
+            'TWITTER_REQUEST_TOKEN_URL', 'TWITTER_ACCESS_TOKEN_URL', 'TWITTER_AUTHORIZATION_URL'))
+        settings.TWITTER_REQUEST_TOKEN_URL = '%s/request_token' % self.provider.url
+        settings.TWITTER_ACCESS_TOKEN_URL = '%s/access_token' % self.provider.url
+        settings.TWITTER_AUTHORIZATION_URL = '%s/authorize' % self.provider.url
+        self.twitter_url = OAuthTwitter.url
+        OAuthTwitter.url = '%s/account/verify_credentials.json' % self.provider.url
+
+        prefix = get_token_prefix(settings.TWITTER_REQUEST_TOKEN_URL)
+        self.session['oauth_%s_request_token' % prefix] = {'oauth_token': 'request', 'oauth_token_secret': 'secret'}
+        self.session['oauth_%s_access_token' % prefix] = {'oauth_token': 'access', 'oauth_token_secret': 'secret'}
+
+    def tearDown(self):
+        for name, value in self.settings.items():
+            setattr(settings, name, value)
+        OAuthTwitter.url = self.twitter_url
+        http_pool.clear()
+        self.provider.stop()
+
+    def oauth_args(self):
+        return ('key', 'secret', settings.TWITTER_REQUEST_TOKEN_URL,
+            settings.TWITTER_ACCESS_TOKEN_URL, settings.TWITTER_AUTHORIZATION_URL, 'twitter')
+
+    def test_oauth_redirect(self):
+        authorize = '%s?oauth_token=request&' % settings.TWITTER_AUTHORIZATION_URL
+        response = self.assertQueries(0, oauth_redirect, self.request(), *self.oauth_args())
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(response['Location'].startswith(authorize))
+        self.assertFalse('socialregistration_connect_object' in self.session)
+
+        data = {'a': 'sites', 'm': 'site', 'i': str(self.site.pk)}
+        response = self.assertQueries(1, oauth_redirect, self.request(data=data), *self.oauth_args())
+        self.assertTrue(response['Location'].startswith(authorize))
+        self.assertEqual(self.session['socialregistration_connect_object'], get_object_reference(data))
+
+    def test_oauth_callback(self):
+        response = self.assertQueries(0, oauth_callback, self.request(), *self.oauth_args())
+        self.assertRedirect(response, reverse('twitter'))
+        # messages of anonymous users need the messages middleware
+        response = self.assertQueries(1, oauth_callback, self.login_request(data={'denied': 'request'}),
+            *self.oauth_args())
+        self.assertRedirect(response, settings.LOGIN_REDIRECT_URL)
+
+    def test_twitter(self):
+        # new user
+        request = self.request()
+        self.assertSetup(self.assertQueries(1, twitter, request), request)
+
+        TwitterProfile.objects.create(content_object=self.user, twitter_id=1)
+        request = self.request()
+        self.assertLoggedIn(self.assertQueries(7, twitter, request), request)
+
+        self.deactivate()
+        request = self.request()
+        self.assertInactive(self.assertQueries(1, twitter, request), request)
+
+    def test_twitter_connect(self):
+        # creates the profile of the logged in user, then finds it
+        self.assertConnected(self.assertQueries(2, twitter, self.login_request()), TwitterProfile, self.user)
+        self.assertConnected(self.assertQueries(1, twitter, self.login_request()), TwitterProfile, self.user)
+
+        self.connect()
+        self.assertConnected(self.assertQueries(3, twitter, self.request()), TwitterProfile, self.site)
+        self.connect()
+        self.assertConnected(self.assertQueries(2, twitter, self.request()), TwitterProfile, self.site)
+
+class SocialRegistrationOpenIDQueryBudgetTests(SocialRegistrationQueryBudgetTests):
+
+    def setUp(self):
+        super(SocialRegistrationOpenIDQueryBudgetTests, self).setUp()
+        self.provider = StubOpenIDProvider().start()
+        self.identity = '%s/alice' % self.provider.url
+
+    def tearDown(self):
+        self.provider.stop()
+
+    def callback(self, request_factory, data={}):
+        """
+        Runs ``openid_redirect`` with ``data`` and returns a request made with
+        ``request_factory`` carrying the provider's positive assertion.
+        """
+        response = openid_redirect(self.request(data=dict(data, openid_provider=self.provider.url)))
+        request = request_factory('get', self.provider.assertion(response['Location'], self.identity))
+        return request
+
+    def test_openid_redirect(self):
+        response = self.assertQueries(2, openid_redirect, self.request(data={'openid_provider': self.provider.url}))
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(response['Location'].startswith('%s/server?' % self.provider.url))
+
+    def test_openid_callback(self):
+        # new user
+        request = self.callback(self.request)
+        self.assertSetup(self.assertQueries(4, openid_callback, request), request)
+
+        OpenIDProfile.objects.create(content_object=self.user, identity=self.identity)
+        request = self.callback(self.request)
+        self.assertLoggedIn(self.assertQueries(10, openid_callback, request), request)
+
+        self.deactivate()
+        request = self.callback(self.request)
+        self.assertInactive(self.assertQueries(4, openid_callback, request), request)
+
+    def test_openid_connect(self):
+        # creates the profile of the logged in user, then finds it
+        response = self.assertQueries(5, openid_callback, self.callback(self.login_request))
+        self.assertConnected(response, OpenIDProfile, self.user)
+        response = self.assertQueries(4, openid_callback, self.callback(self.login_request))
+        self.assertConnected(response, OpenIDProfile, self.user)
+
+        data = {'a': 'sites', 'm': 'site', 'i': str(self.site.pk)}
+        response = self.assertQueries(6, openid_callback, self.callback(self.request, data))
+        self.assertConnected(response, OpenIDProfile, self.site)
+        response = self.assertQueries(5, openid_callback, self.callback(self.request, data))
+        self.assertConnected(response, OpenIDProfile, self.site)
+
+class SocialRegistrationTemplateTagQueryBudgetTests(SocialRegistrationQueryBudgetTests):
+
+    def render(self, template, request, **context):
+        context['request'] = request
+        return Template(template).render(Context(context))
+
+    def test_info_tags(self):
+        for library, tag in (('facebook_tags', 'facebook_info'), ('twitter_tags', 'twitter_info'),
+            ('openid_tags', 'openid_info')):
+            template = '{%% load %s %%}{%% %s as profile %%}{%% %s as profile %%}' % (library, tag, tag)
+            self.assertQueries(0, self.render, template, self.request())
+            self.assertQueries(1, self.render, template, self.login_request())
+            self.assertQueries(1, self.render, template, self.request(),
+                socialregistration_connect_object=self.site)
+
+        FacebookProfile.objects.create(content_object=self.user, uid='1234567890')
+        template = '{% load facebook_tags %}{% facebook_info as profile %}{{ profile.uid }}'
+        self.assertQueries(1, self.render, template, self.login_request())
+
+    def test_social_profiles(self):
+        template = '{% load socialregistration_tags %}{% social_profiles for user as profiles %}'
+        self.assertQueries(1, self.render, template, self.request(), user=self.user)
+        self.assertQueries(1, self.render, template, self.request(), user=self.site)
+
+    def test_buttons(self):
+        for library, tag in (('facebook_tags', 'facebook_button'), ('twitter_tags', 'twitter_button'),
+            ('openid_tags', 'openid_form')):
+            template = '{%% load %s %%}{%% %s %%}' % (library, tag)
+            self.assertQueries(0, self.render, template, self.request())
+            self.assertQueries(0, self.render, template, self.login_request())
+            self.assertQueries(0, self.render, template, self.request(),
+                socialregistration_connect_object=self.site)
+
+    def test_settings_tags(self):
+        template = ('{% load socialregistration_tags facebook_tags twitter_tags %}'
+            '{% social_csrf_token %}{% open_id_errors request %}{% auth_enabled facebook as fb %}'
+            '{% auth_enabled twitter as tw %}{% facebook_configured as fb %}{% twitter_configured as tw %}'
+            '{% facebook_js %}')
+        self.session['openid_error'] = True
+        self.assertQueries(0, self.render, template, self.request())
@@ -0,0 +1,72 @@
+"""
+Prints the query plans of the profile lookups before and after the indexes
+of migrations 0006 and 0007, on a throwaway test database of the configured
+project. South has to be installed::
+
+    DJANGO_SETTINGS_MODULE=settings python -m socialregistration.tests.query_plans
+
+The indexes only exist in the migrations, so the plans before them are those
+of tables created with ``syncdb --all``.
+"""
+import sys
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import setup_test_environment
+from django.utils.importlib import import_module
+from socialregistration.models import FacebookProfile, TwitterProfile, OpenIDProfile
+
+def lookups():
+    """
+    Returns the querysets of the lookups the indexes are for, by name.
+    """
+    user = User(pk=1)
+    content_type = ContentType.objects.get_for_model(User)
+    return (
+        ('FacebookProfile by uid', FacebookProfile.objects.by_remote_id('1234567890').filter(content_type=content_type)),
+        ('TwitterProfile by twitter_id', TwitterProfile.objects.by_remote_id(1).filter(content_type=content_type)),
+        ('OpenIDProfile by identity', OpenIDProfile.objects.by_remote_id('http://example.com/').filter(content_type=content_type)),
+        ('FacebookProfile for object', FacebookProfile.objects.for_object_content_type(user).filter(object_id=user.pk)),
+        ('TwitterProfile for object', TwitterProfile.objects.for_object_content_type(user).filter(object_id=user.pk)),
+        ('OpenIDProfile for object', OpenIDProfile.objects.for_object_content_type(user).filter(object_id=user.pk)),
+    )
+
+def explain(queryset):
+    sql, params = queryset.query.get_compiler(queryset.db).as_sql()
+    if connection.vendor == 'sqlite':
+        sql = 'EXPLAIN QUERY PLAN %s' % sql
+    else:
+        sql = 'EXPLAIN %s' % sql
+    cursor = connection.cursor()
+    cursor.execute(sql, params)
+    return [' '.join([unicode(column) for column in row]) for row in cursor.fetchall()]
+
+def print_plans(title):
+    sys.stdout.write('== %s ==\n' % title)
+    for name, queryset in lookups():
+        sys.stdout.write('%s\n' % name)
+        for line in explain(queryset):
+            sys.stdout.write('    %s\n' % line)
+
+def main():
+    if 'south' not in settings.INSTALLED_APPS:
+        sys.exit('The indexes are added by South migrations, please add south to INSTALLED_APPS.')
+    setup_test_environment()
+    old_name = settings.DATABASES['default']['NAME']
+    connection.creation.create_test_db(verbosity=0)
+    try:
+        call_command('syncdb', migrate_all=True, interactive=False, verbosity=0)
+        print_plans('syncdb')
+        from south.db import db
+        import_module('socialregistration.migrations.0006_add_profile_lookup_indexes').Migration().forwards(None)
+        # 0007 also adds the identity_hash column, which syncdb already created
+        db.create_index('socialregistration_openidprofile', ['identity_hash', 'site_id', 'content_type_id'])
+        print_plans('migrations 0006 and 0007')
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,190 @@
+"""
+Local stand-ins for the providers socialregistration talks to, so tests can
+exercise the real HTTP code paths without leaving the machine.
+"""
+import cgi
+import hashlib
+import threading
+import time
+import urllib
+from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+from SocketServer import ThreadingMixIn
+from urlparse import urlparse, parse_qsl
+
+from django.utils import simplejson
+from openid.store.nonce import mkNonce
+
+class StubRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # send each response in one go, piecemeal writes stall on delayed ACKs
+    wbufsize = -1
+
+    def do_GET(self):
+        self.server.stub.handle(self, 'GET')
+
+    def do_POST(self):
+        self.server.stub.handle(self, 'POST')
+
+    def log_message(self, *args):
+        pass
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    # room for concurrent clients, the default of 5 drops connections
+    request_queue_size = 64
+
+    def handle_error(self, request, client_address):
+        # clients dropping kept-alive connections are nothing to report
+        pass
+
+class StubServer(object):
+    """
+    Serves HTTP/1.1 with keep-alive on a free local port in a background
+    thread. Subclasses implement ``respond``, every request is recorded in
+    ``requests`` and the client port it arrived on in ``clients``. Responses
+    are held back for ``delay`` seconds.
+    """
+    delay = 0
+
+    def __init__(self):
+        self.requests = []
+        self.clients = []
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), StubRequestHandler)
+        self.server.stub = self
+        self.thread = threading.Thread(target=self.server.serve_forever, kwargs={'poll_interval': 0.01})
+        self.thread.setDaemon(True)
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:%s' % self.server.server_port
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def handle(self, handler, method):
+        length = int(handler.headers.getheader('content-length') or 0)
+        body = handler.rfile.read(length)
+        self.requests.append((method, handler.path, body))
+        self.clients.append(handler.client_address)
+        time.sleep(self.delay)
+        status, content_type, content = self.respond(method, handler.path, body)
+        handler.send_response(status)
+        handler.send_header('Content-Type', content_type)
+        handler.send_header('Content-Length', str(len(content)))
+        handler.end_headers()
+        handler.wfile.write(content)
+
+    def respond(self, method, path, body):
+        raise NotImplementedError
+
+    @property
+    def connections(self):
+        return len(set(self.clients))
+
+XRDS = """<?xml version="1.0" encoding="UTF-8"?>
+<xrds:XRDS xmlns:xrds="xri://$xrds" xmlns="xri://$xrd*($v*2.0)">
+  <XRD>
+    <Service priority="0">
+      <Type>http://specs.openid.net/auth/2.0/%s</Type>
+      <URI>%s/server</URI>
+    </Service>
+  </XRD>
+</xrds:XRDS>
+"""
+
+class StubOpenIDProvider(StubServer):
+    """
+    OpenID 2.0 provider advertising its endpoint through an XRDS document at
+    its root URL and any other path as a claimed identifier. Association
+    requests are refused, so consumers fall back to stateless mode and have
+    every ``assertion`` confirmed through check_authentication.
+    """
+    def respond(self, method, path, body):
+        if method == 'GET':
+            service = path == '/' and 'server' or 'signon'
+            return 200, 'application/xrds+xml', XRDS % (service, self.url)
+        if dict(parse_qsl(body)).get('openid.mode') == 'check_authentication':
+            return 200, 'text/plain', 'ns:http://specs.openid.net/auth/2.0\nis_valid:true\n'
+        return 400, 'text/plain', 'error:associations are not supported\nerror_code:unsupported-type\n'
+
+    def assertion(self, redirect_url, claimed_id):
+        """
+        Returns the URL a positive assertion of ``claimed_id`` in response to
+        the authentication request at ``redirect_url`` sends the user back to.
+        """
+        request = dict(parse_qsl(urlparse(redirect_url)[4]))
+        signed = ('op_endpoint', 'claimed_id', 'identity', 'return_to', 'response_nonce', 'assoc_handle')
+        response = {
+            'openid.ns': 'http://specs.openid.net/auth/2.0',
+            'openid.mode': 'id_res',
+            'openid.op_endpoint': '%s/server' % self.url,
+            'openid.claimed_id': claimed_id,
+            'openid.identity': claimed_id,
+            'openid.return_to': request['openid.return_to'],
+            'openid.response_nonce': mkNonce(),
+            'openid.assoc_handle': 'stateless',
+            'openid.signed': ','.join(signed),
+            'openid.sig': 'stub',
+        }
+        separator = '?' in request['openid.return_to'] and '&' or '?'
+        return request['openid.return_to'] + separator + urllib.urlencode(response)
+
+    @property
+    def discoveries(self):
+        return len([r for r in self.requests if r[0] == 'GET'])
+
+class StubOAuthProvider(StubServer):
+    """
+    OAuth 1.0 provider handing out fixed request and access tokens and
+    answering every other request with a JSON user object. The first
+    ``failures`` requests are answered with a 503.
+    """
+    failures = 0
+    user = {'id': 1, 'screen_name': 'stub'}
+
+    def respond(self, method, path, body):
+        if len(self.requests) <= self.failures:
+            return 503, 'text/plain', 'Over capacity'
+        if path.startswith('/request_token'):
+            return 200, 'text/plain', 'oauth_token=request&oauth_token_secret=secret&oauth_callback_confirmed=true'
+        if path.startswith('/access_token'):
+            return 200, 'text/plain', 'oauth_token=access&oauth_token_secret=secret&user_id=1&screen_name=stub'
+        return 200, 'application/json', simplejson.dumps(self.user)
+
+def facebook_cookie(uid, app_id, app_secret, expires=0):
+    """
+    Returns the name and value of the cookie Facebook's JavaScript SDK sets
+    for ``uid``, signed the way ``facebook.get_user_from_cookie`` checks.
+    """
+    args = {
+        'uid': str(uid),
+        'access_token': 'stub',
+        'session_key': 'stub',
+        'secret': 'stub',
+        'expires': str(expires),
+    }
+    payload = ''.join('%s=%s' % (key, args[key]) for key in sorted(args))
+    args['sig'] = hashlib.md5(payload + app_secret).hexdigest()
+    return 'fbs_' + app_id, '"%s"' % urllib.urlencode(args)
+
+def get_user_from_cookie(cookies, app_id, app_secret):
+    """
+    Stand-in for ``facebook.get_user_from_cookie`` checking the cookies made
+    by ``facebook_cookie`` the way the classic SDK did, without asking the
+    Graph API to exchange a code like newer versions do.
+    """
+    cookie = cookies.get('fbs_' + app_id, '')
+    if not cookie:
+        return None
+    args = dict((key, values[-1]) for key, values in cgi.parse_qs(cookie.strip('"')).items())
+    payload = ''.join('%s=%s' % (key, args[key]) for key in sorted(args) if key != 'sig')
+    expires = int(args['expires'])
+    if hashlib.md5(payload + app_secret).hexdigest() == args.get('sig') and (
+        expires == 0 or time.time() < expires):
+        return args
+    return None
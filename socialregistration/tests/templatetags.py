@@ -1,10 +1,11 @@
 from django import template
 from django.conf import settings
-from django.contrib.auth.models import User
+from django.contrib.auth.models import User, AnonymousUser
+from django.contrib.contenttypes.models import ContentType
 from django.contrib.sites.models import Site
 from django.http import HttpRequest
 from django.test import TestCase
-from socialregistration.models import FacebookProfile, TwitterProfile, OpenIDProfile
+from socialregistration.models import FacebookProfile, TwitterProfile, OpenIDProfile, profiles_for_object
 
 class MockUser(object):
     auth = False
@@ -188,6 +189,9 @@ class SocialRegistrationTemplateTagTests(TestCase):
 
         fbp = FacebookProfile.objects.create(content_object=Site.objects.get_current(), uid=1234567890, consumer_key='aaaaaa', consumer_secret='bbbbbb')
 
+        # on a new page, the last request remembers there was no profile
+        request = MockHttpRequest()
+
         result = self.render(template, {'request': request, 'socialregistration_connect_object': Site.objects.get_current()})
         self.assertEqual(result, "yes")
 
@@ -205,6 +209,10 @@ class SocialRegistrationTemplateTagTests(TestCase):
 
         fbp = FacebookProfile.objects.create(content_object=u1, uid=1234567890, consumer_key='aaaaaa', consumer_secret='bbbbbb')
 
+        # on a new page, the last request remembers there was no profile
+        request = MockHttpRequest()
+        request.user = u1
+
         result = self.render(template, {'request': request,})
         self.assertEqual(result, "yes")
 
@@ -219,6 +227,9 @@ class SocialRegistrationTemplateTagTests(TestCase):
 
         twp = TwitterProfile.objects.create(content_object=Site.objects.get_current(), twitter_id=1234567890, consumer_key='aaaaaa', consumer_secret='bbbbbb')
 
+        # on a new page, the last request remembers there was no profile
+        request = MockHttpRequest()
+
         result = self.render(template, {'request': request, 'socialregistration_connect_object': Site.objects.get_current()})
         self.assertEqual(result, "yes")
 
@@ -235,6 +246,10 @@ class SocialRegistrationTemplateTagTests(TestCase):
 
         twp = TwitterProfile.objects.create(content_object=u1, twitter_id=1234567890, consumer_key='aaaaaa', consumer_secret='bbbbbb')
 
+        # on a new page, the last request remembers there was no profile
+        request = MockHttpRequest()
+        request.user = u1
+
         result = self.render(template, {'request': request,})
         self.assertEqual(result, "yes")
 
@@ -249,6 +264,9 @@ class SocialRegistrationTemplateTagTests(TestCase):
 
         oip = OpenIDProfile.objects.create(content_object=Site.objects.get_current(), identity='aa')
 
+        # on a new page, the last request remembers there was no profile
+        request = MockHttpRequest()
+
         result = self.render(template, {'request': request, 'socialregistration_connect_object': Site.objects.get_current()})
         self.assertEqual(result, "yes")
 
@@ -265,7 +283,50 @@ class SocialRegistrationTemplateTagTests(TestCase):
 
         oip = OpenIDProfile.objects.create(content_object=u1, identity='aa')
 
+        # on a new page, the last request remembers there was no profile
+        request = MockHttpRequest()
+        request.user = u1
+
         result = self.render(template, {'request': request,})
         self.assertEqual(result, "yes")
 
         oip.delete()
+
+    def test_info_tags_query_once(self):
+        u1 = User.objects.create(username='user1')
+        request = MockHttpRequest()
+        request.user = u1
+
+        # warm the site and content type caches
+        Site.objects.get_current()
+        ContentType.objects.get_for_model(User)
+
+        template = """{% load facebook_tags %}{% facebook_info as fb %}{% facebook_info as fb %}{% facebook_info as fb %}{% if fb %}yes{% else %}no{% endif %}"""
+        # the missing profile is remembered as well
+        self.assertNumQueries(1, self.render, template, {'request': request})
+
+        request = MockHttpRequest()
+        request.user = u1
+        FacebookProfile.objects.create(content_object=u1, uid=1234567890, consumer_key='aaaaaa', consumer_secret='bbbbbb')
+        self.assertNumQueries(1, self.render, template, {'request': request})
+        self.assertEqual(self.render(template, {'request': request}), "yes")
+
+    def test_social_profiles(self):
+        u1 = User.objects.create(username='user1')
+        FacebookProfile.objects.create(content_object=u1, uid=1234567890, consumer_key='aaaaaa', consumer_secret='bbbbbb')
+        OpenIDProfile.objects.create(content_object=u1, identity='aa')
+        # warm the site and content type caches
+        Site.objects.get_current()
+        ContentType.objects.get_for_model(User)
+
+        template = """{% load socialregistration_tags %}{% social_profiles for user as profiles %}{{ profiles.facebook.uid }}|{{ profiles.twitter }}|{{ profiles.openid.identity }}"""
+        self.assertNumQueries(1, self.render, template, {'user': u1})
+        self.assertEqual(self.render(template, {'user': u1}), "1234567890|None|aa")
+        self.assertEqual(self.render(template, {'user': Site.objects.get_current()}), "|None|")
+        self.assertNumQueries(0, self.render, template, {'user': AnonymousUser()})
+        self.assertEqual(self.render(template, {'user': AnonymousUser()}), "|None|")
+        self.assertEqual(self.render(template, {}), "|None|")
+
+        profile = profiles_for_object(u1)['facebook']
+        self.assertEqual(profile, FacebookProfile.objects.get(uid=1234567890))
+        self.assertEqual(profile.content_object, u1)
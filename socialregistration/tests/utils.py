@@ -0,0 +1,545 @@
+import os
+import subprocess
+import sys
+import threading
+import time
+from StringIO import StringIO
+
+from django.conf import settings
+from django.contrib.sites.models import Site
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.http import HttpRequest
+from django.test import TestCase, TransactionTestCase
+from django.utils import unittest
+from openid import fetchers, oidutil
+from openid.association import Association
+from socialregistration.models import OpenIDStore as OpenIDStoreModel, OpenIDNonce
+from socialregistration.tests.stubs import StubOpenIDProvider, StubOAuthProvider
+from socialregistration.utils import (LRUCache, OpenIDStore, CacheOpenIDStore,
+    OpenID, OAuthClient, OAuth, OAuthTwitter, OAuthError, ProviderUnavailable, ConnectionPool,
+    get_openid_store, association_cache, discovery_cache, http_pool,
+    OpenIDFetcher, circuit_breakers, get_token_prefix)
+from socialregistration.views import oauth_redirect, openid_redirect
+
+try:
+    import gevent
+except ImportError:
+    gevent = None
+
+class SocialRegistrationLRUCacheTests(TestCase):
+
+    def test_eviction(self):
+        lru = LRUCache(max_size=2)
+        lru.set('a', 1)
+        lru.set('b', 2)
+        self.assertEqual(lru.get('a'), 1)
+        # 'b' is now the least recently used entry
+        lru.set('c', 3)
+        self.assertEqual(lru.get('b'), None)
+        self.assertEqual(lru.get('a'), 1)
+        self.assertEqual(lru.get('c'), 3)
+        self.assertEqual(len(lru), 2)
+        self.assertEqual((lru.hits, lru.misses), (3, 1))
+
+    def test_timeout(self):
+        lru = LRUCache()
+        lru.set('a', 1, timeout=-1)
+        self.assertEqual(lru.get('a'), None)
+        lru.set('a', 1, timeout=60)
+        self.assertEqual(lru.get('a'), 1)
+        lru.delete('a')
+        self.assertEqual(lru.get('a'), None)
+
+class SocialRegistrationOpenIDStoreTests(TestCase):
+
+    def setUp(self):
+        association_cache.clear()
+
+    def tearDown(self):
+        association_cache.clear()
+
+    def test_nonce(self):
+        store = OpenIDStore()
+        now = int(time.time())
+        self.assertTrue(store.useNonce('http://example.com/', now, 'salt'))
+        self.assertFalse(store.useNonce('http://example.com/', now, 'salt'))
+        self.assertTrue(store.useNonce('http://example.com/', now + 1, 'salt'))
+        self.assertEqual(OpenIDNonce.objects.count(), 2)
+        # too old to be checked for replays
+        self.assertFalse(store.useNonce('http://example.com/', now - store.max_nonce_age - 1, 'salt'))
+
+    def test_nonce_single_statement(self):
+        store = OpenIDStore()
+        now = int(time.time())
+        store.useNonce('http://example.com/', now, 'salt')
+        # a replay is detected by the failing insert alone
+        if not connection.features.uses_savepoints:
+            self.assertNumQueries(1, store.useNonce, 'http://example.com/', now, 'salt')
+
+    def test_association(self):
+        store = OpenIDStore()
+        now = int(time.time())
+        store.storeAssociation('http://example.com/', Association('old', 'secret', now - 10, 3600, 'HMAC-SHA1'))
+        store.storeAssociation('http://example.com/', Association('new', 'secret', now, 3600, 'HMAC-SHA1'))
+        store.storeAssociation('http://example.com/', Association('expired', 'secret', now - 7200, 3600, 'HMAC-SHA1'))
+
+        assoc = store.getAssociation('http://example.com/')
+        self.assertEqual((assoc.handle, assoc.secret, assoc.lifetime), ('new', 'secret', 3600))
+        self.assertEqual(store.getAssociation('http://example.com/', 'old').handle, 'old')
+        self.assertEqual(store.getAssociation('http://example.com/', 'expired'), None)
+        # expired associations are removed along the way
+        self.assertEqual(sorted(OpenIDStoreModel.objects.values_list('handle', flat=True)), [u'new', u'old'])
+
+        store.removeAssociation('http://example.com/', 'new')
+        self.assertEqual(store.getAssociation('http://example.com/').handle, 'old')
+
+    def test_association_cache(self):
+        now = int(time.time())
+        OpenIDStore().storeAssociation('http://example.com/', Association('handle', 'secret', now, 3600, 'HMAC-SHA1'))
+
+        # any other store of the process finds it without touching the database
+        store = OpenIDStore()
+        self.assertNumQueries(0, store.getAssociation, 'http://example.com/')
+        self.assertNumQueries(0, store.getAssociation, 'http://example.com/', 'handle')
+        self.assertEqual(store.getAssociation('http://example.com/').handle, 'handle')
+
+        store.removeAssociation('http://example.com/', 'handle')
+        self.assertEqual(OpenIDStore().getAssociation('http://example.com/'), None)
+        self.assertEqual(OpenIDStore().getAssociation('http://example.com/', 'handle'), None)
+
+    def test_association_cache_expiry(self):
+        now = int(time.time())
+        OpenIDStore().storeAssociation('http://example.com/', Association('handle', 'secret', now - 3601, 3600, 'HMAC-SHA1'))
+        self.assertEqual(len(association_cache), 0)
+        self.assertEqual(OpenIDStore().getAssociation('http://example.com/'), None)
+
+    def test_association_queries(self):
+        store = OpenIDStore()
+        now = int(time.time())
+        for i in range(2000):
+            OpenIDStoreModel.objects.create(server_url='http://example.com/', handle='handle%s' % i,
+                secret='', issued=now - i, lifetime=3600, expires_at=now - i + 3600, assoc_type='HMAC-SHA1')
+            OpenIDStoreModel.objects.create(server_url='http://example.com/', handle='expired%s' % i,
+                secret='', issued=now - 7200, lifetime=3600, expires_at=now - 3600, assoc_type='HMAC-SHA1')
+
+        # one query to fetch the newest association and one to delete all expired ones
+        self.assertNumQueries(2, store.getAssociation, 'http://example.com/')
+        self.assertEqual(store.getAssociation('http://example.com/').handle, 'handle0')
+        self.assertEqual(OpenIDStoreModel.objects.count(), 2000)
+
+    def test_cleanup(self):
+        store = OpenIDStore()
+        store.cleanup_batch_size = 2
+        now = int(time.time())
+        for salt in ('a', 'b', 'c'):
+            OpenIDNonce.objects.create(server_url='http://example.com/', timestamp=now - store.max_nonce_age - 1, salt=salt)
+        OpenIDNonce.objects.create(server_url='http://example.com/', timestamp=now, salt='d')
+
+        OpenIDStoreModel.objects.create(server_url='http://example.com/', handle='old',
+            secret='', issued=now - 7200, lifetime=3600, expires_at=now - 3600, assoc_type='HMAC-SHA1')
+        OpenIDStoreModel.objects.create(server_url='http://example.com/', handle='new',
+            secret='', issued=now, lifetime=3600, expires_at=now + 3600, assoc_type='HMAC-SHA1')
+
+        self.assertEqual(store.cleanup(), (3, 1))
+        self.assertEqual(list(OpenIDNonce.objects.values_list('salt', flat=True)), [u'd'])
+        self.assertEqual(list(OpenIDStoreModel.objects.values_list('handle', flat=True)), [u'new'])
+
+    def test_cleanup_command(self):
+        OpenIDNonce.objects.create(server_url='http://example.com/', timestamp=1, salt='a')
+        out = StringIO()
+        call_command('cleanup_openid', batch_size=10, stdout=out)
+        self.assertEqual(out.getvalue(), 'Removed 1 expired nonces and 0 expired associations.\n')
+        self.assertEqual(OpenIDNonce.objects.count(), 0)
+
+def shares_database_between_threads():
+    return not (connection.vendor == 'sqlite' and
+        connection.settings_dict.get('TEST_NAME') in (None, '', ':memory:'))
+
+class SocialRegistrationOpenIDStoreConcurrencyTests(TransactionTestCase):
+
+    @unittest.skipUnless(shares_database_between_threads(),
+        "threads don't share an in-memory SQLite database")
+    def test_concurrent_nonce(self):
+        results = []
+        now = int(time.time())
+        def use_nonce():
+            try:
+                results.append(OpenIDStore().useNonce('http://example.com/', now, 'salt'))
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=use_nonce) for i in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(sorted(results), [False] * 9 + [True])
+        self.assertEqual(OpenIDNonce.objects.count(), 1)
+
+    def test_nonce_inserted_concurrently(self):
+        # the row another request inserted after this one saw no nonce yet,
+        # only the failing insert can tell
+        now = int(time.time())
+        OpenIDNonce.objects.create(server_url='http://example.com/', timestamp=now, salt='salt')
+        transaction.enter_transaction_management()
+        transaction.managed(True)
+        try:
+            self.assertFalse(OpenIDStore().useNonce('http://example.com/', now, 'salt'))
+            # the failed insert leaves the surrounding transaction usable
+            self.assertTrue(OpenIDStore().useNonce('http://example.com/', now, 'pepper'))
+            transaction.commit()
+        finally:
+            transaction.leave_transaction_management()
+        self.assertEqual(sorted(OpenIDNonce.objects.values_list('salt', flat=True)), [u'pepper', u'salt'])
+
+class SocialRegistrationCacheOpenIDStoreTests(TestCase):
+
+    def setUp(self):
+        # set up a site object in case the current site ID doesn't exist
+        site = Site.objects.get_or_create(pk=settings.SITE_ID)
+        cache.clear()
+        association_cache.clear()
+        self.store = CacheOpenIDStore()
+
+    def tearDown(self):
+        cache.clear()
+        association_cache.clear()
+
+    def association(self, handle='handle'):
+        return Association(handle, 'secret', int(time.time()), 3600, 'HMAC-SHA1')
+
+    def test_association(self):
+        self.assertEqual(self.store.getAssociation('http://example.com/'), None)
+
+        self.store.storeAssociation('http://example.com/', self.association())
+        self.assertEqual(self.store.getAssociation('http://example.com/').handle, 'handle')
+        self.assertEqual(self.store.getAssociation('http://example.com/', 'handle').handle, 'handle')
+        self.assertEqual(self.store.getAssociation('http://example.com/', 'other'), None)
+        # served from the cache
+        self.assertNumQueries(0, self.store.getAssociation, 'http://example.com/')
+
+        self.store.removeAssociation('http://example.com/', 'handle')
+        self.assertEqual(self.store.getAssociation('http://example.com/'), None)
+        self.assertEqual(OpenIDStoreModel.objects.count(), 0)
+
+    def test_association_persisted(self):
+        self.store.storeAssociation('http://example.com/', self.association())
+        self.assertEqual(OpenIDStoreModel.objects.filter(server_url='http://example.com/').count(), 1)
+
+        cache.clear()
+        association_cache.clear()
+        self.assertEqual(self.store.getAssociation('http://example.com/', 'handle').handle, 'handle')
+
+    def test_nonce(self):
+        now = int(time.time())
+        self.assertTrue(self.store.useNonce('http://example.com/', now, 'salt'))
+        self.assertFalse(self.store.useNonce('http://example.com/', now, 'salt'))
+        self.assertTrue(self.store.useNonce('http://example.com/', now, 'pepper'))
+        # too old to be checked for replays
+        self.assertFalse(self.store.useNonce('http://example.com/', now - self.store.max_nonce_age - 1, 'salt'))
+
+    def test_get_openid_store(self):
+        pre_store = getattr(settings, 'SOCIALREGISTRATION_OPENID_STORE', None)
+        settings.SOCIALREGISTRATION_OPENID_STORE = 'socialregistration.utils.CacheOpenIDStore'
+        self.assertTrue(isinstance(get_openid_store(), CacheOpenIDStore))
+        del settings.SOCIALREGISTRATION_OPENID_STORE
+        self.assertEqual(get_openid_store().__class__, OpenIDStore)
+        if pre_store is not None:
+            settings.SOCIALREGISTRATION_OPENID_STORE = pre_store
+
+class MockHttpRequest(HttpRequest):
+    def __init__(self, *args, **kwargs):
+        super(MockHttpRequest, self).__init__(*args, **kwargs)
+        self.session = {}
+
+class SocialRegistrationOpenIDDiscoveryTests(TestCase):
+
+    def setUp(self):
+        # set up a site object in case the current site ID doesn't exist
+        site = Site.objects.get_or_create(pk=settings.SITE_ID)
+        self.provider = StubOpenIDProvider().start()
+        # keep python-openid from logging to stderr
+        self.oidutil_log = oidutil.log
+        oidutil.log = lambda message, level=0: None
+        self.pre_timeout = getattr(settings, 'SOCIALREGISTRATION_OPENID_DISCOVERY_CACHE_TIMEOUT', 0)
+        settings.SOCIALREGISTRATION_OPENID_DISCOVERY_CACHE_TIMEOUT = 60
+        discovery_cache.clear()
+
+    def tearDown(self):
+        self.provider.stop()
+        oidutil.log = self.oidutil_log
+        settings.SOCIALREGISTRATION_OPENID_DISCOVERY_CACHE_TIMEOUT = self.pre_timeout
+        discovery_cache.clear()
+
+    def redirect(self, endpoint):
+        return OpenID(MockHttpRequest(), 'http://example.com/callback/', endpoint).get_redirect()
+
+    def test_discovery_cached(self):
+        response = self.redirect(self.provider.url)
+        self.assertTrue(response['Location'].startswith('%s/server?' % self.provider.url))
+        self.assertEqual(self.provider.discoveries, 1)
+
+        # the same provider, spelled differently
+        response = self.redirect(self.provider.url + '/')
+        self.assertTrue(response['Location'].startswith('%s/server?' % self.provider.url))
+        self.assertEqual(self.provider.discoveries, 1)
+
+    def test_discovery_not_cached(self):
+        settings.SOCIALREGISTRATION_OPENID_DISCOVERY_CACHE_TIMEOUT = 0
+        self.redirect(self.provider.url)
+        self.redirect(self.provider.url)
+        self.assertEqual(self.provider.discoveries, 2)
+
+    def test_single_round_trip_per_redirect(self):
+        settings.SOCIALREGISTRATION_OPENID_DISCOVERY_CACHE_TIMEOUT = 0
+        request = MockHttpRequest()
+        request.GET['openid_provider'] = self.provider.url
+        response = openid_redirect(request)
+        self.assertTrue(response['Location'].startswith('%s/server?' % self.provider.url))
+        # one discovery and one (refused) association request
+        self.assertEqual(self.provider.requests, [
+            ('GET', '/', ''), ('POST', '/server', self.provider.requests[1][2])])
+
+class SocialRegistrationHTTPPoolTests(TestCase):
+
+    def setUp(self):
+        site = Site.objects.get_or_create(pk=settings.SITE_ID)
+        self.provider = StubOAuthProvider().start()
+        http_pool.clear()
+
+    def tearDown(self):
+        http_pool.clear()
+        self.provider.stop()
+
+    def oauth_client(self, request):
+        return OAuthClient(request, 'key', 'secret',
+            '%s/request_token' % self.provider.url,
+            '%s/access_token' % self.provider.url,
+            '%s/authorize' % self.provider.url,
+            'twitter')
+
+    def test_connection_reused(self):
+        request = MockHttpRequest()
+        # every view builds a new client, they should share one connection
+        for i in range(3):
+            self.oauth_client(request).get_redirect()
+        self.assertTrue(self.oauth_client(request).is_valid())
+        oauth = OAuth(request, 'key', 'secret', '%s/request_token' % self.provider.url)
+        oauth.query('%s/verify_credentials.json' % self.provider.url)
+        self.assertEqual(len(self.provider.requests), 5)
+        self.assertEqual(self.provider.connections, 1)
+
+    def test_idle_timeout(self):
+        pool = ConnectionPool(max_size=1, idle_timeout=-1)
+        pool.release('http:example.com', ConnectionStub())
+        self.assertEqual(pool.acquire('http:example.com'), None)
+
+    def test_max_size(self):
+        pool = ConnectionPool(max_size=1)
+        first, second = ConnectionStub(), ConnectionStub()
+        pool.release('http:example.com', first)
+        pool.release('http:example.com', second)
+        self.assertTrue(second.closed)
+        self.assertTrue(pool.acquire('http:example.com') is first)
+        self.assertEqual(pool.acquire('http:example.com'), None)
+
+class SocialRegistrationProviderResilienceTests(TestCase):
+
+    def setUp(self):
+        site = Site.objects.get_or_create(pk=settings.SITE_ID)
+        self.provider = StubOAuthProvider().start()
+        self.pre_settings = {}
+        for name, value in (('HTTP_RETRY_BACKOFF', 0), ('HTTP_RETRIES', 2),
+            ('HTTP_TIMEOUT', 10), ('CIRCUIT_BREAKER_THRESHOLD', 5)):
+            name = 'SOCIALREGISTRATION_%s' % name
+            self.pre_settings[name] = getattr(settings, name, None)
+            setattr(settings, name, value)
+        circuit_breakers.clear()
+
+    def tearDown(self):
+        http_pool.clear()
+        self.provider.stop()
+        for name, value in self.pre_settings.items():
+            if value is None:
+                delattr(settings, name)
+            else:
+                setattr(settings, name, value)
+        circuit_breakers.clear()
+
+    def redirect(self):
+        return oauth_redirect(MockHttpRequest(), 'key', 'secret',
+            '%s/request_token' % self.provider.url,
+            '%s/access_token' % self.provider.url,
+            '%s/authorize' % self.provider.url,
+            'twitter')
+
+    def query(self, method='GET'):
+        request = MockHttpRequest()
+        request.session['oauth_%s_access_token' % get_token_prefix(self.provider.url)] = {
+            'oauth_token': 'access', 'oauth_token_secret': 'secret'}
+        oauth = OAuth(request, 'key', 'secret', '%s/request_token' % self.provider.url)
+        return oauth.query('%s/verify_credentials.json' % self.provider.url, method)
+
+    def test_retry(self):
+        self.provider.failures = 2
+        response = self.redirect()
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(len(self.provider.requests), 3)
+
+    def test_no_retry_for_access_token(self):
+        self.provider.failures = 1
+        request = MockHttpRequest()
+        request.session['oauth_%s_request_token' % get_token_prefix(self.provider.url)] = {
+            'oauth_token': 'request', 'oauth_token_secret': 'secret'}
+        client = OAuthClient(request, 'key', 'secret',
+            '%s/request_token' % self.provider.url,
+            '%s/access_token' % self.provider.url,
+            '%s/authorize' % self.provider.url,
+            'twitter')
+        self.assertFalse(client.is_valid())
+        self.assertEqual(len(self.provider.requests), 1)
+
+    def test_no_retry_for_post(self):
+        self.provider.failures = 1
+        self.assertRaises(OAuthError, self.query, 'POST')
+        self.assertEqual(len(self.provider.requests), 1)
+
+    def test_timeout(self):
+        settings.SOCIALREGISTRATION_HTTP_RETRIES = 0
+        settings.SOCIALREGISTRATION_HTTP_TIMEOUT = 0.1
+        self.provider.delay = 0.5
+        start = time.time()
+        self.assertRaises(OAuthError, self.query)
+        self.assertTrue(time.time() - start < 0.5)
+
+    def test_error_context(self):
+        self.provider.failures = 3
+        extra_context = {'title': 'Twitter'}
+        response = oauth_redirect(MockHttpRequest(), 'key', 'secret',
+            '%s/request_token' % self.provider.url,
+            '%s/access_token' % self.provider.url,
+            '%s/authorize' % self.provider.url,
+            'twitter', None, 'socialregistration/oauthcallback.html', extra_context)
+        self.assertEqual(response.status_code, 200)
+        # the client is only added to this response's context
+        self.assertEqual(extra_context, {'title': 'Twitter'})
+
+    def test_timeout_fetcher(self):
+        # OpenID requests get the same timeouts unless the project opted out
+        self.assertTrue(isinstance(fetchers.getDefaultFetcher().fetcher, OpenIDFetcher))
+
+    def test_circuit_breaker(self):
+        settings.SOCIALREGISTRATION_CIRCUIT_BREAKER_THRESHOLD = 2
+        self.provider.failures = 6
+        self.assertRaises(OAuthError, self.query)
+        self.assertRaises(OAuthError, self.query)
+        self.assertRaises(ProviderUnavailable, self.query)
+        self.assertEqual(len(self.provider.requests), 6)
+
+        # the redirect view fails fast with the callback template
+        response = self.redirect()
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue('is currently unavailable' in response.content)
+        self.assertEqual(len(self.provider.requests), 6)
+
+class SocialRegistrationConcurrentHandshakeTests(TestCase):
+
+    def setUp(self):
+        Site.objects.get_or_create(pk=settings.SITE_ID)
+        # warm the site cache, the threads can't see the in-memory database
+        Site.objects.get_current()
+        self.provider = StubOAuthProvider()
+        self.provider.delay = 0.1
+        self.provider.start()
+
+    def tearDown(self):
+        http_pool.clear()
+        self.provider.stop()
+
+    def test_concurrent_redirects(self):
+        count = 10
+        responses = []
+        def redirect():
+            try:
+                responses.append(oauth_redirect(MockHttpRequest(), 'key', 'secret',
+                    '%s/request_token' % self.provider.url,
+                    '%s/access_token' % self.provider.url,
+                    '%s/authorize' % self.provider.url,
+                    'twitter'))
+            except Exception, e:
+                responses.append(e)
+
+        threads = [threading.Thread(target=redirect) for i in range(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(self.provider.requests), count)
+        self.assertEqual([getattr(response, 'status_code', response) for response in responses], [302] * count)
+        self.assertEqual(len(set(response['Location'] for response in responses)), 1)
+
+class SocialRegistrationGreenTests(TestCase):
+
+    @unittest.skipUnless(gevent is not None, 'gevent is not installed')
+    def test_patch(self):
+        # patching affects the whole process, so it happens in one of its own
+        script = '\n'.join([
+            'from openid import fetchers',
+            'fetchers.setDefaultFetcher(object.__new__(fetchers.CurlHTTPFetcher))',
+            'from socialregistration import green',
+            'green.patch()',
+            'from gevent import monkey',
+            "print monkey.is_module_patched('socket'), type(fetchers.getDefaultFetcher().fetcher).__name__",
+        ])
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+        process = subprocess.Popen([sys.executable, '-c', script], env=env,
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        out, errors = process.communicate()
+        self.assertEqual(process.returncode, 0, errors)
+        self.assertEqual(out.split(), ['True', 'OpenIDFetcher'])
+
+class SocialRegistrationTwitterUserInfoTests(TestCase):
+
+    def setUp(self):
+        self.provider = StubOAuthProvider().start()
+        self.pre_timeout = getattr(settings, 'SOCIALREGISTRATION_TWITTER_USER_INFO_CACHE_TIMEOUT', 0)
+        settings.SOCIALREGISTRATION_TWITTER_USER_INFO_CACHE_TIMEOUT = 60
+        self.request = MockHttpRequest()
+        self.request.session['oauth_%s_access_token' % get_token_prefix(self.provider.url)] = {
+            'oauth_token': 'access', 'oauth_token_secret': 'secret'}
+
+    def tearDown(self):
+        http_pool.clear()
+        self.provider.stop()
+        settings.SOCIALREGISTRATION_TWITTER_USER_INFO_CACHE_TIMEOUT = self.pre_timeout
+        cache.clear()
+
+    def twitter(self):
+        twitter = OAuthTwitter(self.request, 'key', 'secret', '%s/request_token' % self.provider.url)
+        twitter.url = '%s/verify_credentials.json' % self.provider.url
+        return twitter
+
+    def test_cached(self):
+        self.assertEqual(self.twitter().get_user_info()['screen_name'], 'stub')
+        self.assertEqual(self.twitter().get_user_info()['screen_name'], 'stub')
+        self.assertEqual(len(self.provider.requests), 1)
+
+        self.twitter().invalidate_user_info()
+        self.twitter().get_user_info()
+        self.assertEqual(len(self.provider.requests), 2)
+
+    def test_not_cached(self):
+        settings.SOCIALREGISTRATION_TWITTER_USER_INFO_CACHE_TIMEOUT = 0
+        self.twitter().get_user_info()
+        self.twitter().get_user_info()
+        self.assertEqual(len(self.provider.requests), 2)
+
+class ConnectionStub(object):
+    closed = False
+
+    def close(self):
+        self.closed = True
@@ -0,0 +1,219 @@
+import logging
+import pickle
+
+from django.conf import settings
+from django.contrib.auth.models import User, AnonymousUser
+from django.contrib.sessions.middleware import SessionMiddleware
+from django.contrib.sites.models import Site
+from django.db import connection
+from django.http import HttpResponse
+from django.template import Template, RequestContext
+from django.test import TestCase
+from django.test.client import RequestFactory
+from django.utils import simplejson
+from django.utils.importlib import import_module
+from socialregistration.middleware import Facebook
+from socialregistration.models import FacebookProfile, SESSION_STATE_VERSION
+from socialregistration.tests.stubs import StubOAuthProvider
+from socialregistration.utils import http_pool
+from socialregistration.views import (facebook_login, facebook_connect, oauth_redirect,
+    setup, get_object_reference, _get_connect_object)
+
+class SocialRegistrationViewTests(TestCase):
+
+    def setUp(self):
+        # set up a site object in case the current site ID doesn't exist
+        site = Site.objects.get_or_create(pk=settings.SITE_ID)
+        self.factory = RequestFactory()
+        self.engine = import_module(settings.SESSION_ENGINE)
+        self.session = self.engine.SessionStore()
+
+    def request(self, method='get', path='/', data={}):
+        request = getattr(self.factory, method)(path, data)
+        request.session = self.session
+        request.user = AnonymousUser()
+        request.facebook = Facebook({'uid': '1234567890', 'access_token': 'aaaaaa'})
+        request._dont_enforce_csrf_checks = True
+        return request
+
+class SocialRegistrationSessionStateTests(SocialRegistrationViewTests):
+
+    def test_setup_from_session_state(self):
+        response = facebook_login(self.request())
+        self.assertEqual(response.status_code, 302)
+
+        state = self.session['socialregistration_profile']
+        self.assertEqual(state['v'], SESSION_STATE_VERSION)
+        self.assertEqual(state['fields']['uid'], '1234567890')
+        self.assertFalse('socialregistration_user' in self.session)
+        # the session holds no model instances any more
+        simplejson.dumps(dict(self.session.items()))
+        self.assertTrue(len(pickle.dumps(state, pickle.HIGHEST_PROTOCOL)) <
+            len(pickle.dumps(FacebookProfile(uid='1234567890'), pickle.HIGHEST_PROTOCOL)))
+
+        response = setup(self.request('post', data={'username': 'alice', 'email': ''}))
+        self.assertEqual(response.status_code, 302)
+        profile = FacebookProfile.objects.get(uid='1234567890')
+        self.assertEqual(profile.content_object, User.objects.get(username='alice'))
+        self.assertEqual(self.session['_auth_user_id'], profile.object_id)
+        self.assertFalse('socialregistration_profile' in self.session)
+
+    def test_setup_unsupported_version(self):
+        state = FacebookProfile(uid='1234567890').to_session_state()
+        state['v'] = SESSION_STATE_VERSION + 1
+        self.session['socialregistration_profile'] = state
+        response = setup(self.request())
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(FacebookProfile.objects.count(), 0)
+
+    def test_connect_object_reference(self):
+        site = Site.objects.get_current()
+        reference = get_object_reference({'a': 'sites', 'm': 'site', 'i': str(site.pk)})
+        simplejson.dumps(reference)
+
+        self.session['socialregistration_connect_object'] = reference
+        self.assertEqual(_get_connect_object(self.request()), site)
+
+        # objects stored by the application itself keep working
+        self.session['socialregistration_connect_object'] = site
+        self.assertEqual(_get_connect_object(self.request()), site)
+
+        self.assertEqual(get_object_reference({}), None)
+        # unknown objects fail before the provider round trip, not after it
+        self.assertRaises(Site.DoesNotExist, get_object_reference, {'a': 'sites', 'm': 'site', 'i': '999'})
+
+def open_id_errors(request):
+    template = Template("{% load socialregistration_tags %}{% open_id_errors request %}{{ openid_error }}")
+    return HttpResponse(template.render(RequestContext(request)))
+
+class SocialRegistrationSessionWriteTests(SocialRegistrationViewTests):
+
+    def setUp(self):
+        super(SocialRegistrationSessionWriteTests, self).setUp()
+        self.saves = 0
+        self.store_save = self.engine.SessionStore.save
+        def save(store, *args, **kwargs):
+            self.saves += 1
+            return self.store_save(store, *args, **kwargs)
+        self.engine.SessionStore.save = save
+
+    def tearDown(self):
+        self.engine.SessionStore.save = self.store_save
+
+    def seed(self, **values):
+        for key, value in values.items():
+            self.session[key] = value
+        self.session.save()
+        self.session = self.engine.SessionStore(self.session.session_key)
+        self.saves = 0
+
+    def run_view(self, view, request, *args, **kwargs):
+        """
+        Runs ``view`` and saves the session the way the session middleware
+        does, counting the saves in ``self.saves``.
+        """
+        response = view(request, *args, **kwargs)
+        response = SessionMiddleware().process_response(request, response)
+        # the next request loads the session afresh, like from its cookie
+        self.session = self.engine.SessionStore(request.session.session_key)
+        return response
+
+    def test_open_id_errors(self):
+        # left behind by a successful OpenID login
+        self.seed(openid_provider='http://example.com/')
+        response = self.run_view(open_id_errors, self.request())
+        self.assertEqual(response.content, 'False')
+        self.assertEqual(self.saves, 0)
+
+        self.seed(openid_error=True)
+        response = self.run_view(open_id_errors, self.request())
+        self.assertEqual(response.content, 'True')
+        self.assertEqual(self.saves, 1)
+
+        response = self.run_view(open_id_errors, self.request())
+        self.assertEqual(response.content, 'False')
+        self.assertEqual(self.saves, 1)
+
+    def test_facebook_connect(self):
+        user = User.objects.create(username='alice')
+        FacebookProfile.objects.create(content_object=user, uid='1234567890')
+
+        request = self.request()
+        request.user = user
+        response = self.run_view(facebook_connect, request)
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.saves, 0)
+
+        self.seed(next='/after/')
+        request = self.request()
+        request.user = user
+        response = self.run_view(facebook_connect, request)
+        self.assertEqual(response['Location'], '/after/')
+        self.assertEqual(self.saves, 1)
+
+    def test_oauth_redirect(self):
+        provider = StubOAuthProvider().start()
+        try:
+            self.seed(next='/after/')
+            response = self.run_view(oauth_redirect, self.request(), 'key', 'secret',
+                '%s/request_token' % provider.url, '%s/access_token' % provider.url,
+                '%s/authorize' % provider.url, 'twitter')
+        finally:
+            http_pool.clear()
+            provider.stop()
+        self.assertEqual(response.status_code, 302)
+        # only the request token was written
+        self.assertEqual(self.saves, 1)
+        self.assertEqual(self.session['next'], '/after/')
+        self.assertFalse('socialregistration_connect_object' in self.session)
+
+class RecordingHandler(logging.Handler):
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+class SocialRegistrationLoggingTests(SocialRegistrationViewTests):
+
+    def setUp(self):
+        super(SocialRegistrationLoggingTests, self).setUp()
+        self.logger = logging.getLogger(getattr(settings, 'SOCIALREGISTRATION_LOGGER_NAME', 'socialregistration'))
+        self.level = self.logger.level
+        self.handler = RecordingHandler()
+        self.logger.addHandler(self.handler)
+
+    def tearDown(self):
+        self.logger.removeHandler(self.handler)
+        self.logger.setLevel(self.level)
+
+    def count_queries(self, func, *args):
+        connection.use_debug_cursor = True
+        start = len(connection.queries)
+        try:
+            func(*args)
+        finally:
+            connection.use_debug_cursor = False
+        return len(connection.queries) - start
+
+    def test_debug_values_skipped(self):
+        self.session['socialregistration_profile'] = FacebookProfile(uid='1234567890').to_session_state()
+
+        self.logger.setLevel(logging.DEBUG)
+        debug_queries = self.count_queries(setup, self.request())
+        self.assertTrue(self.handler.records)
+
+        self.handler.records = []
+        self.logger.setLevel(logging.WARNING)
+        # the profile count is only looked up to be logged
+        self.assertEqual(self.count_queries(setup, self.request()), debug_queries - 1)
+        self.assertEqual(self.handler.records, [])
+
+    def test_password_not_logged(self):
+        self.session['socialregistration_profile'] = FacebookProfile(uid='1234567890').to_session_state()
+        self.logger.setLevel(logging.DEBUG)
+        setup(self.request('post', data={'username': 'alice', 'password': 'secret'}))
+        self.assertTrue(self.handler.records)
+        for record in self.handler.records:
+            self.assertFalse('secret' in record.getMessage())
@@ -7,10 +7,17 @@ Inspired by:
     http://github.com/leah/python-oauth/blob/master/oauth/example/client.py
     http://github.com/facebook/tornado/blob/master/tornado/auth.py
 """
+from __future__ import with_statement
+
 import time
 import base64
+import hashlib
+import httplib
+import random
+import socket
 import urllib
 import urllib2
+import threading
 
 # parse_qsl was moved from the cgi namespace to urlparse in Python2.6.
 # this allows backwards compatibility
@@ -19,25 +26,40 @@ try:
 except ImportError:
     from cgi import parse_qsl
 
+# OrderedDict is only available from Python 2.7 on, SortedDict does the same
+# job for older versions.
+try:
+    from collections import OrderedDict
+except ImportError:
+    from django.utils.datastructures import SortedDict as OrderedDict
+
 from xml.dom import minidom
 
+import httplib2
 import oauth2 as oauth
+from openid import fetchers
 from openid.consumer import consumer as openid
-from openid.consumer.discover import DiscoveryFailure
+from openid.consumer.discover import DiscoveryFailure, discover, normalizeURL, normalizeXRI
+from openid.yadis import xri, xrires
 from openid.store.interface import OpenIDStore as OIDStore
 from openid.association import Association as OIDAssociation
 
+from django.db import connection, transaction, IntegrityError
 from django.http import HttpResponseRedirect
+from django.core.cache import cache
 from django.core.urlresolvers import reverse
+from django.utils.importlib import import_module
 from django.utils.translation import gettext as _
 
 from django.conf import settings
 from django.utils import simplejson
+from django.utils.encoding import smart_str
 
 from django.contrib.sites.models import Site
 
 
 from socialregistration.models import OpenIDStore as OpenIDStoreModel, OpenIDNonce
+from socialregistration.metrics import timed
 from urlparse import urlparse
 
 USE_HTTPS = bool(getattr(settings, 'SOCIALREGISTRATION_USE_HTTPS', False))
@@ -48,8 +70,84 @@ def _https():
     else:
         return ''
 
+class LRUCache(object):
+    """
+    Bounded, thread safe in-process cache. Once ``max_size`` entries are
+    stored the least recently used one is dropped. ``hits`` and ``misses``
+    count the lookups for monitoring.
+    """
+    def __init__(self, max_size=1000):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        self._lock.acquire()
+        try:
+            try:
+                value, expires = self._data.pop(key)
+            except KeyError:
+                self.misses += 1
+                return default
+            if expires is not None and expires <= time.time():
+                self.misses += 1
+                return default
+            # re-insert to mark it as most recently used
+            self._data[key] = (value, expires)
+            self.hits += 1
+            return value
+        finally:
+            self._lock.release()
+
+    def set(self, key, value, timeout=None):
+        """
+        Stores ``value`` under ``key``, for ``timeout`` seconds if given.
+        """
+        if timeout is not None:
+            expires = time.time() + timeout
+        else:
+            expires = None
+        self._lock.acquire()
+        try:
+            self._data.pop(key, None)
+            self._data[key] = (value, expires)
+            while len(self._data) > self.max_size:
+                del self._data[iter(self._data).next()]
+        finally:
+            self._lock.release()
+
+    def delete(self, key):
+        self._lock.acquire()
+        try:
+            self._data.pop(key, None)
+        finally:
+            self._lock.release()
+
+    def clear(self):
+        self._lock.acquire()
+        try:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+        finally:
+            self._lock.release()
+
+    def __len__(self):
+        return len(self._data)
+
+
+# Associations with OpenID providers, shared by every ``OpenIDStore`` of the
+# process and keyed by ``(server_url, handle)``. ``(server_url, None)`` holds
+# the handle of the newest association with a provider. Other processes only
+# notice a removed association once it expires or they're told so by the
+# provider themselves.
+association_cache = LRUCache(getattr(settings, 'SOCIALREGISTRATION_OPENID_ASSOCIATION_CACHE_SIZE', 100))
+
 class OpenIDStore(OIDStore):
     max_nonce_age = 6 * 60 * 60
+    cleanup_batch_size = 1000
 
     def storeAssociation(self, server_url, assoc=None):
         stored_assoc = OpenIDStoreModel.objects.create(
@@ -57,38 +155,80 @@ class OpenIDStore(OIDStore):
             handle=assoc.handle,
             secret=base64.encodestring(assoc.secret),
             issued=assoc.issued,
-            lifetime=assoc.issued,
+            lifetime=assoc.lifetime,
+            expires_at=assoc.issued + assoc.lifetime,
             assoc_type=assoc.assoc_type
         )
-
+        self._cache_association(server_url, assoc)
 
     def getAssociation(self, server_url, handle=None):
+        assoc = self._get_cached_association(server_url, handle)
+        if assoc is None:
+            assoc = self._load_association(server_url, handle)
+            if assoc is not None:
+                self._cache_association(server_url, assoc, latest=not handle)
+        return assoc
+
+    def _get_cached_association(self, server_url, handle):
+        """
+        Looks the association up in the in-process ``association_cache``
+        shared by all stores of this process.
+        """
+        if not handle:
+            handle = association_cache.get((server_url, None))
+            if handle is None:
+                return None
+        return association_cache.get((server_url, handle))
+
+    def _cache_association(self, server_url, assoc, latest=True):
+        """
+        Keeps ``assoc`` in the in-process ``association_cache`` for as long as
+        it's valid. With ``latest`` it's also returned for lookups without a
+        handle.
+        """
+        expires_in = assoc.getExpiresIn()
+        if expires_in <= 0 or not association_cache.max_size:
+            return
+        association_cache.set((server_url, assoc.handle), assoc, expires_in)
+        if latest:
+            association_cache.set((server_url, None), assoc.handle, expires_in)
+
+    def _load_association(self, server_url, handle):
+        now = int(time.time())
+
         stored_assocs = OpenIDStoreModel.objects.filter(
-            server_url=server_url
+            server_url=server_url,
+            expires_at__gt=now
         )
         if handle:
             stored_assocs = stored_assocs.filter(handle=handle)
 
-        stored_assocs.order_by('-issued')
-
-        if stored_assocs.count() == 0:
-            return None
+        try:
+            stored_assoc = stored_assocs.order_by('-issued')[0]
+        except IndexError:
+            stored_assoc = None
 
-        return_val = None
+        self._delete_expired_associations(server_url, now)
 
-        for stored_assoc in stored_assocs:
-            assoc = OIDAssociation(
-                stored_assoc.handle, base64.decodestring(stored_assoc.secret),
-                stored_assoc.issued, stored_assoc.lifetime, stored_assoc.assoc_type
-            )
+        if stored_assoc is None:
+            return None
 
-            if assoc.getExpiresIn() == 0:
-                stored_assoc.delete()
-            else:
-                if return_val is None:
-                    return_val = assoc
+        return OIDAssociation(
+            stored_assoc.handle, base64.decodestring(stored_assoc.secret),
+            stored_assoc.issued, stored_assoc.lifetime, stored_assoc.assoc_type
+        )
 
-        return return_val
+    def _delete_expired_associations(self, server_url, now):
+        """
+        Removes the expired associations with ``server_url`` in a single
+        statement, without loading them first.
+        """
+        qn = connection.ops.quote_name
+        cursor = connection.cursor()
+        cursor.execute('DELETE FROM %s WHERE %s = %%s AND %s <= %%s' % (
+            qn(OpenIDStoreModel._meta.db_table), qn('server_url'), qn('expires_at')),
+            [server_url, now])
+        transaction.commit_unless_managed()
 
     def removeAssociation(self, server_url, handle):
         stored_assocs = OpenIDStoreModel.objects.filter(
@@ -99,22 +239,194 @@ class OpenIDStore(OIDStore):
 
         stored_assocs.delete()
 
+        association_cache.delete((server_url, handle))
+        if association_cache.get((server_url, None)) == handle:
+            association_cache.delete((server_url, None))
+
     def useNonce(self, server_url, timestamp, salt):
+        # nonces this old are garbage collected and can't be checked anymore
+        if abs(timestamp - time.time()) > self.max_nonce_age:
+            return False
+
+        # The unique constraint on the nonce makes the insert itself the
+        # replay check, which holds up against concurrent requests. The
+        # savepoint keeps a failed insert from aborting the surrounding
+        # transaction.
+        sid = transaction.savepoint()
         try:
-            nonce = OpenIDNonce.objects.get(
+            OpenIDNonce.objects.create(
                 server_url=server_url,
                 timestamp=timestamp,
                 salt=salt
             )
-        except OpenIDNonce.DoesNotExist:
-            nonce = OpenIDNonce.objects.create(
-                server_url=server_url,
-                timestamp=timestamp,
-                salt=salt
-            )
-            return True
+        except IntegrityError:
+            transaction.savepoint_rollback(sid)
+            return False
+        transaction.savepoint_commit(sid)
+        return True
+
+    def _delete_in_batches(self, queryset):
+        """
+        Deletes the rows of ``queryset`` ``cleanup_batch_size`` at a time so
+        the table is never locked for long. Returns the number of rows removed.
+        """
+        removed = 0
+        while True:
+            pks = list(queryset.values_list('pk', flat=True)[:self.cleanup_batch_size])
+            if not pks:
+                return removed
+            queryset.model.objects.filter(pk__in=pks).delete()
+            removed += len(pks)
+
+    def cleanupNonces(self):
+        return self._delete_in_batches(OpenIDNonce.objects.filter(
+            timestamp__lt=int(time.time()) - self.max_nonce_age))
+
+    def cleanupAssociations(self):
+        return self._delete_in_batches(OpenIDStoreModel.objects.filter(
+            expires_at__lte=int(time.time())))
+
+
+class CacheOpenIDStore(OpenIDStore):
+    """
+    OpenID store keeping associations and nonces in Django's cache framework.
+    Associations are also written to the database and read back from it when
+    they dropped out of the cache, nonces only ever live in the cache and
+    expire after ``max_nonce_age``.
+
+    Enable it with::
+
+        SOCIALREGISTRATION_OPENID_STORE = 'socialregistration.utils.CacheOpenIDStore'
+    """
+    def _key(self, *parts):
+        return 'socialregistration.openid.%s' % hashlib.sha1(
+            '\x00'.join([smart_str(part) for part in parts])).hexdigest()
+
+    def _server_key(self, server_url):
+        return self._key('server', server_url)
+
+    def _assoc_key(self, server_url, handle):
+        return self._key('assoc', server_url, handle)
+
+    def _cache_association(self, server_url, assoc, latest=True):
+        super(CacheOpenIDStore, self)._cache_association(server_url, assoc, latest)
+        expires_in = assoc.getExpiresIn()
+        if expires_in > 0:
+            cache.set(self._assoc_key(server_url, assoc.handle), assoc, expires_in)
+            if latest:
+                cache.set(self._server_key(server_url), assoc.handle, expires_in)
+
+    def _load_association(self, server_url, handle):
+        cached_handle = handle or cache.get(self._server_key(server_url))
+        if cached_handle:
+            assoc = cache.get(self._assoc_key(server_url, cached_handle))
+            if assoc is not None and assoc.getExpiresIn() > 0:
+                return assoc
+        return super(CacheOpenIDStore, self)._load_association(server_url, handle)
+
+    def removeAssociation(self, server_url, handle):
+        super(CacheOpenIDStore, self).removeAssociation(server_url, handle)
+        cache.delete(self._assoc_key(server_url, handle))
+        if cache.get(self._server_key(server_url)) == handle:
+            cache.delete(self._server_key(server_url))
+
+    def useNonce(self, server_url, timestamp, salt):
+        # a nonce older than max_nonce_age can't be told apart from a replay
+        # once it dropped out of the cache
+        if abs(timestamp - time.time()) > self.max_nonce_age:
+            return False
+        return cache.add(self._key('nonce', server_url, timestamp, salt),
+            True, self.max_nonce_age)
+
+    def cleanupNonces(self):
+        # nonces expire from the cache on their own
+        return 0
+
+
+def get_openid_store():
+    """
+    Returns an instance of the OpenID store configured with
+    ``SOCIALREGISTRATION_OPENID_STORE``, by default the database backed
+    ``OpenIDStore``.
+    """
+    path = getattr(settings, 'SOCIALREGISTRATION_OPENID_STORE',
+        'socialregistration.utils.OpenIDStore')
+    module, attr = path.rsplit('.', 1)
+    return getattr(import_module(module), attr)()
+
+
+# Services discovered for OpenID identifiers, see ``cached_discover``
+discovery_cache = LRUCache(getattr(settings, 'SOCIALREGISTRATION_OPENID_DISCOVERY_CACHE_SIZE', 100))
+
+def _normalize_identifier(identifier):
+    """
+    Normalizes ``identifier`` the way python-openid does before discovery.
+    """
+    if xri.identifierScheme(identifier) == 'XRI':
+        return normalizeXRI(identifier)
+    if not identifier.startswith('http://') and not identifier.startswith('https://'):
+        identifier = 'http://' + identifier
+    return normalizeURL(identifier)
+
+def _discovery_key(identifier):
+    normalized = _normalize_identifier(identifier)
+    return 'socialregistration.openid.discovery.%s' % hashlib.sha1(smart_str(normalized)).hexdigest()
 
-        return False
+def guarded_discover(identifier):
+    """
+    Runs python-openid's ``discover`` through ``provider_call``, so discovery
+    is retried on network errors and fails fast while the provider is down.
+    """
+    if xri.identifierScheme(identifier) == 'XRI':
+        # XRIs are resolved through python-openid's proxy resolver
+        host = urlparse(xrires.DEFAULT_PROXY)[1]
+    else:
+        host = urlparse(_normalize_identifier(identifier))[1]
+    with timed('discovery', 'openid') as timer:
+        try:
+            result = provider_call(host, lambda: discover(identifier))
+        except ProviderUnavailable, e:
+            raise DiscoveryFailure(e.args[0], None)
+        if not result[1]:
+            timer.outcome = 'no_services'
+    return result
+
+def cached_discover(identifier):
+    """
+    Drop-in replacement for python-openid's ``discover`` that remembers the
+    discovered services for ``SOCIALREGISTRATION_OPENID_DISCOVERY_CACHE_TIMEOUT``
+    seconds, so the handful of providers most users log in with aren't
+    rediscovered on every login. Caching is off unless the timeout is set.
+    With ``SOCIALREGISTRATION_OPENID_DISCOVERY_SHARED_CACHE`` the results are
+    also shared between processes through Django's cache framework.
+    """
+    timeout = getattr(settings, 'SOCIALREGISTRATION_OPENID_DISCOVERY_CACHE_TIMEOUT', 0)
+    if not timeout:
+        return guarded_discover(identifier)
+
+    key = _discovery_key(identifier)
+    use_shared_cache = getattr(settings, 'SOCIALREGISTRATION_OPENID_DISCOVERY_SHARED_CACHE', False)
+
+    result = discovery_cache.get(key)
+    if result is None and use_shared_cache:
+        result = cache.get(key)
+        if result is not None:
+            discovery_cache.set(key, result, timeout)
+
+    if result is None:
+        result = guarded_discover(identifier)
+        # failed discoveries are retried the next time round
+        if result[1]:
+            discovery_cache.set(key, result, timeout)
+            if use_shared_cache:
+                cache.set(key, result, timeout)
+
+    yadis_url, services = result
+    return yadis_url, list(services)
+
+
+class Consumer(openid.Consumer):
+    _discover = staticmethod(cached_discover)
 
 
 class OpenID(object):
@@ -128,13 +440,24 @@ class OpenID(object):
         self.request = request
         self.return_to = return_to
         self.endpoint = endpoint
-        self.store = OpenIDStore()
-        self.consumer = openid.Consumer(self.request.session, self.store)
+        self.store = get_openid_store()
+        self.consumer = Consumer(self.request.session, self.store)
 
+        self.auth_request = None
         self.result = None
 
+    def get_auth_request(self):
+        """
+        Returns the authentication request for ``endpoint``. Discovery and
+        association only happen the first time round.
+        """
+        if self.auth_request is None:
+            with timed('auth_request', 'openid'):
+                self.auth_request = self.consumer.begin(self.endpoint)
+        return self.auth_request
+
     def get_redirect(self):
-        auth_request = self.consumer.begin(self.endpoint)
+        auth_request = self.get_auth_request()
         redirect_url = auth_request.redirectURL(
             'http%s://%s/' % (_https(), Site.objects.get_current().domain),
             self.return_to
@@ -142,11 +465,13 @@ class OpenID(object):
         return HttpResponseRedirect(redirect_url)
 
     def complete(self):
-        self.result = self.consumer.complete(
-            dict(self.request.GET.items()),
-            'http%s://%s%s' % (_https(), Site.objects.get_current(),
-                self.request.path)
-        )
+        with timed('complete', 'openid') as timer:
+            self.result = self.consumer.complete(
+                dict(self.request.GET.items()),
+                'http%s://%s%s' % (_https(), Site.objects.get_current(),
+                    self.request.path)
+            )
+            timer.outcome = self.result.status
 
     def is_valid(self):
         if self.result is None:
@@ -168,10 +493,241 @@ def get_token_prefix(url):
     """
     return urllib2.urlparse.urlparse(url).netloc
 
+def get_network(url):
+    """
+    Returns the network the OAuth endpoint ``url`` belongs to, as the metrics
+    name it: ``twitter`` for the host of ``TWITTER_REQUEST_TOKEN_URL``, the
+    host itself for any other provider.
+    """
+    host = get_token_prefix(url)
+    if host and host == get_token_prefix(getattr(settings, 'TWITTER_REQUEST_TOKEN_URL', '')):
+        return 'twitter'
+    return host
 
 class OAuthError(Exception):
     pass
 
+class ProviderUnavailable(OAuthError):
+    pass
+
+class ProviderError(Exception):
+    pass
+
+
+class ConnectionPool(object):
+    """
+    Thread safe pool of persistent HTTP connections, keyed by
+    ``scheme:authority`` like httplib2 does. Keeping connections to the OAuth
+    providers open saves a TCP and TLS handshake on every request.
+    At most ``max_size`` idle connections are kept per host and connections
+    idle for longer than ``idle_timeout`` seconds are closed.
+    """
+    def __init__(self, max_size=10, idle_timeout=60):
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self._connections = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, key):
+        """
+        Returns an idle connection for ``key`` or ``None``.
+        """
+        self._lock.acquire()
+        try:
+            idle = self._connections.get(key, [])
+            while idle:
+                conn, last_used = idle.pop()
+                if last_used + self.idle_timeout > time.time():
+                    return conn
+                conn.close()
+            return None
+        finally:
+            self._lock.release()
+
+    def release(self, key, conn):
+        """
+        Hands ``conn`` back to the pool once the response has been read.
+        """
+        self._lock.acquire()
+        try:
+            idle = self._connections.setdefault(key, [])
+            if len(idle) < self.max_size:
+                idle.append((conn, time.time()))
+                return
+        finally:
+            self._lock.release()
+        conn.close()
+
+    def clear(self):
+        self._lock.acquire()
+        try:
+            for idle in self._connections.values():
+                for conn, last_used in idle:
+                    conn.close()
+            self._connections.clear()
+        finally:
+            self._lock.release()
+
+http_pool = ConnectionPool(
+    getattr(settings, 'SOCIALREGISTRATION_HTTP_POOL_SIZE', 10),
+    getattr(settings, 'SOCIALREGISTRATION_HTTP_POOL_IDLE_TIMEOUT', 60))
+
+def pooled_request(client, uri, method='GET', **kwargs):
+    """
+    Performs ``client.request`` over a connection from ``http_pool`` and
+    returns the connection to the pool afterwards, if the server kept it open.
+    """
+    scheme, authority = httplib2.urlnorm(uri)[:2]
+    key = '%s:%s' % (scheme, authority)
+    conn = http_pool.acquire(key)
+    if conn is not None:
+        client.connections[key] = conn
+    try:
+        return client.request(uri, method, **kwargs)
+    finally:
+        conn = client.connections.pop(key, None)
+        if conn is not None and conn.sock is not None:
+            http_pool.release(key, conn)
+
+def get_http_timeout(host):
+    """
+    Returns the timeout in seconds for requests to ``host``, as configured in
+    ``SOCIALREGISTRATION_HTTP_TIMEOUTS`` or ``SOCIALREGISTRATION_HTTP_TIMEOUT``.
+    """
+    timeouts = getattr(settings, 'SOCIALREGISTRATION_HTTP_TIMEOUTS', {})
+    default = getattr(settings, 'SOCIALREGISTRATION_HTTP_TIMEOUT', 10)
+    return timeouts.get(host, timeouts.get(host.split(':')[0], default))
+
+
+class CircuitBreaker(object):
+    """
+    Stops calling a provider for ``reset_timeout`` seconds once ``threshold``
+    calls in a row failed. After that one trial call is let through, a success
+    closes the circuit again.
+    """
+    def __init__(self, threshold=5, reset_timeout=30):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    def allow(self):
+        self._lock.acquire()
+        try:
+            if self.opened_at is None:
+                return True
+            if self.opened_at + self.reset_timeout <= time.time():
+                # let a single trial call through per ``reset_timeout``
+                self.opened_at = time.time()
+                return True
+            return False
+        finally:
+            self._lock.release()
+
+    def success(self):
+        self._lock.acquire()
+        try:
+            self.failures = 0
+            self.opened_at = None
+        finally:
+            self._lock.release()
+
+    def failure(self):
+        self._lock.acquire()
+        try:
+            self.failures += 1
+            if self.failures >= self.threshold:
+                self.opened_at = time.time()
+        finally:
+            self._lock.release()
+
+circuit_breakers = {}
+circuit_breakers_lock = threading.Lock()
+
+def get_circuit_breaker(host):
+    circuit_breakers_lock.acquire()
+    try:
+        if host not in circuit_breakers:
+            circuit_breakers[host] = CircuitBreaker(
+                getattr(settings, 'SOCIALREGISTRATION_CIRCUIT_BREAKER_THRESHOLD', 5),
+                getattr(settings, 'SOCIALREGISTRATION_CIRCUIT_BREAKER_TIMEOUT', 30))
+        return circuit_breakers[host]
+    finally:
+        circuit_breakers_lock.release()
+
+# Errors worth retrying and counting against a provider's circuit breaker
+PROVIDER_ERRORS = (ProviderError, socket.error, httplib.HTTPException,
+    httplib2.HttpLib2Error, fetchers.HTTPFetchingError)
+
+def provider_call(host, call, idempotent=True):
+    """
+    Returns ``call()``, retrying idempotent calls that failed with one of
+    ``PROVIDER_ERRORS`` up to ``SOCIALREGISTRATION_HTTP_RETRIES`` times with a
+    jittered exponential backoff. Raises ``ProviderUnavailable`` without
+    calling ``host`` while its circuit breaker is open.
+    """
+    breaker = get_circuit_breaker(host)
+    if not breaker.allow():
+        raise ProviderUnavailable(_('"%s" is currently unavailable.') % host)
+
+    retries = getattr(settings, 'SOCIALREGISTRATION_HTTP_RETRIES', 2) if idempotent else 0
+    backoff = getattr(settings, 'SOCIALREGISTRATION_HTTP_RETRY_BACKOFF', 0.1)
+
+    attempt = 0
+    while True:
+        try:
+            result = call()
+        except PROVIDER_ERRORS:
+            if attempt >= retries:
+                breaker.failure()
+                raise
+            attempt += 1
+            time.sleep(random.uniform(0, backoff * 2 ** attempt))
+        else:
+            breaker.success()
+            return result
+
+def provider_request(client, uri, method='GET', idempotent=None, **kwargs):
+    """
+    Performs a ``pooled_request`` with the timeout configured for the host of
+    ``uri``, guarded by ``provider_call``. Only GET requests are retried,
+    unless ``idempotent`` says otherwise.
+    """
+    if idempotent is None:
+        idempotent = method == 'GET'
+    host = httplib2.urlnorm(uri)[1]
+    client.timeout = get_http_timeout(host)
+
+    def call():
+        response, content = pooled_request(client, uri, method, **kwargs)
+        if int(response['status']) >= 500:
+            raise ProviderError(response, content)
+        return response, content
+
+    try:
+        return provider_call(host, call, idempotent=idempotent)
+    except ProviderError, e:
+        # leave it to the caller to report the last server error
+        return e.args
+    except PROVIDER_ERRORS:
+        raise OAuthError(_('Could not reach "%s".') % host)
+
+
+class OpenIDFetcher(fetchers.Urllib2Fetcher):
+    """
+    python-openid fetcher that applies ``get_http_timeout`` to discovery and
+    association requests.
+    """
+    def urlopen(self, request):
+        return urllib2.urlopen(request, timeout=get_http_timeout(request.get_host()))
+
+# python-openid has one fetcher for the whole process and none of its own
+# fetchers time out. Projects installing a fetcher of their own opt out.
+if getattr(settings, 'SOCIALREGISTRATION_OPENID_TIMEOUT_FETCHER', True):
+    fetchers.setDefaultFetcher(OpenIDFetcher())
+
+
 class OAuthClient(object):
 
     def __init__(self, request, consumer_key, consumer_secret, request_token_url,
@@ -205,10 +761,11 @@ class OAuthClient(object):
         sign the request to obtain the access token
         """
         if self.request_token is None:
-            response, content = self.client.request(self.request_token_url, "GET")
-            if response['status'] != '200':
-                raise OAuthError(
-                    _('Invalid response while obtaining request token from "%s".') % get_token_prefix(self.request_token_url))
+            with timed('request_token', get_network(self.request_token_url)):
+                response, content = provider_request(self.client, self.request_token_url, "GET")
+                if response['status'] != '200':
+                    raise OAuthError(
+                        _('Invalid response while obtaining request token from "%s".') % get_token_prefix(self.request_token_url))
             self.request_token = dict(parse_qsl(content))
             self.request.session['oauth_%s_request_token' % get_token_prefix(self.request_token_url)] = self.request_token
         return self.request_token
@@ -221,10 +778,12 @@ class OAuthClient(object):
             request_token = self._get_rt_from_session()
             token = oauth.Token(request_token['oauth_token'], request_token['oauth_token_secret'])
             self.client = oauth.Client(self.consumer, token)
-            response, content = self.client.request(self.access_token_url, "GET")
-            if response['status'] != '200':
-                raise OAuthError(
-                    _('Invalid response while obtaining access token from "%s".') % get_token_prefix(self.request_token_url))
+            with timed('access_token', get_network(self.request_token_url)):
+                # the request token can only be exchanged once, so this isn't retried
+                response, content = provider_request(self.client, self.access_token_url, "GET", idempotent=False)
+                if response['status'] != '200':
+                    raise OAuthError(
+                        _('Invalid response while obtaining access token from "%s".') % get_token_prefix(self.request_token_url))
             self.access_token = dict(parse_qsl(content))
 
             self.request.session['oauth_%s_access_token' % get_token_prefix(self.request_token_url)] = self.access_token
@@ -278,6 +837,8 @@ class OAuth(object):
 
         self.request_token_url = request_token_url
 
+        self.errors = []
+
     def _get_at_from_session(self):
         """
         Get the saved access token for private resources from the session.
@@ -301,8 +862,8 @@ class OAuth(object):
 
         body = urllib.urlencode(params)
 
-        response, content = client.request(url, method=method, headers=headers,
-            body=body)
+        response, content = provider_request(client, url, method=method,
+            headers=headers, body=body)
 
         if response['status'] != '200':
             raise OAuthError(
@@ -316,6 +877,35 @@ class OAuthTwitter(OAuth):
     """
     url = 'https://twitter.com/account/verify_credentials.json'
 
+    def _get_user_info_cache_key(self):
+        access_token = self._get_at_from_session()
+        return 'socialregistration.twitter.user_info.%s' % hashlib.sha1(
+            smart_str(access_token['oauth_token'])).hexdigest()
+
     def get_user_info(self):
-        user = simplejson.loads(self.query(self.url))
+        """
+        Returns the user's Twitter account. With
+        ``SOCIALREGISTRATION_TWITTER_USER_INFO_CACHE_TIMEOUT`` set it is kept
+        in Django's cache for that many seconds per access token.
+        """
+        timeout = getattr(settings, 'SOCIALREGISTRATION_TWITTER_USER_INFO_CACHE_TIMEOUT', 0)
+        with timed('user_info', 'twitter') as timer:
+            if timeout:
+                key = self._get_user_info_cache_key()
+                user = cache.get(key)
+                if user is not None:
+                    timer.outcome = 'cached'
+                    return user
+
+            user = simplejson.loads(self.query(self.url))
+
+        if timeout:
+            cache.set(key, user, timeout)
         return user
+
+    def invalidate_user_info(self):
+        """
+        Drops the cached account of the current access token, e.g. after the
+        user changed it through the API.
+        """
+        cache.delete(self._get_user_info_cache_key())
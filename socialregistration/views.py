@@ -1,3 +1,5 @@
+from __future__ import with_statement
+
 import logging
 import uuid
 
@@ -6,6 +8,7 @@ from django.contrib import messages
 from django.template import RequestContext
 from django.contrib.contenttypes.models import ContentType
 from django.core.urlresolvers import reverse
+from django.db import models
 from django.shortcuts import render_to_response
 from django.utils.translation import gettext as _
 from django.http import HttpResponseRedirect
@@ -22,9 +25,11 @@ from django.contrib.contenttypes.models import ContentType
 from django.contrib.sites.models import Site
 
 from socialregistration.forms import UserForm, ClaimForm, ExistingUser
-from socialregistration.utils import (OAuthClient, OAuthTwitter,
-    OpenID, _https, DiscoveryFailure)
-from socialregistration.models import FacebookProfile, TwitterProfile, OpenIDProfile
+from socialregistration.utils import (OAuthClient, OAuthTwitter, OAuthError,
+    OpenID, _https, DiscoveryFailure, get_network)
+from socialregistration.models import (FacebookProfile, TwitterProfile, OpenIDProfile,
+    BaseSocialProfile, SESSION_STATE_VERSION, PROFILE_MODELS)
+from socialregistration.metrics import timed, timed_view
 
 
 FB_ERROR = _('We couldn\'t validate your Facebook credentials')
@@ -33,6 +38,8 @@ GENERATE_USERNAME = bool(getattr(settings, 'SOCIALREGISTRATION_GENERATE_USERNAME
 
 logger = logging.getLogger(getattr(settings, 'SOCIALREGISTRATION_LOGGER_NAME', 'socialregistration'))
 
+_network_names = dict((model, name) for name, model in PROFILE_MODELS)
+
 
 def post_disconnect_redirect_url(instance, request=None):
     # first check to see if the object has a URL
@@ -59,9 +66,10 @@ def disconnect(request, network, object_type, object_id):
     content_object = model.objects.get(pk=object_id)
 
     if request.method == 'POST':
-        logger.info("Disconnecting %s social profile %s because the user requested it. They will be redirected to %s." % (profile_model, object_id, post_disconnect_redirect_url(content_object)))
+        redirect_url = post_disconnect_redirect_url(content_object)
+        logger.info("Disconnecting %s social profile %s because the user requested it. They will be redirected to %s.", profile_model, object_id, redirect_url)
         profile.delete()
-        return HttpResponseRedirect(post_disconnect_redirect_url(content_object))
+        return HttpResponseRedirect(redirect_url)
     else:
         return render_to_response('socialregistration/confirm_disconnect.html', {
             'profile': profile,
@@ -83,12 +91,24 @@ def _get_next(request):
     else:
         return getattr(settings, 'LOGIN_REDIRECT_URL', '/')
 
-def _authenticate_login_redirect(request):
+def _set_session_value(request, key, value):
+    """
+    Stores ``value`` in the session, or removes ``key`` if it is ``None``,
+    without marking the session modified when nothing changes.
+    """
+    if value is None:
+        if key in request.session:
+            del request.session[key]
+    elif key not in request.session or request.session[key] != value:
+        request.session[key] = value
+
+def _authenticate_login_redirect(request, profile):
     """
     Authenticates user, clears unneeded session variables, and redirects them.
     """
-    user = request.session['socialregistration_profile'].authenticate()
+    user = profile.authenticate()
     login(request, user)
+    # sessions of older versions also kept an unsaved user around
     if 'socialregistration_user' in request.session: del request.session['socialregistration_user']
     if 'socialregistration_profile' in request.session: del request.session['socialregistration_profile']
     return HttpResponseRedirect(_get_next(request))
@@ -99,12 +119,15 @@ def setup(request, template='socialregistration/setup.html',
     Setup view to create a username & set email address after authentication
     """
     try:
-        social_user = request.session['socialregistration_user']
         social_profile = request.session['socialregistration_profile']
-    except KeyError:
-        logger.error("A KeyError was encountered while setting up a socialregistration account. Session was: %s" % request.session)
+        if not isinstance(social_profile, BaseSocialProfile):
+            social_profile = BaseSocialProfile.from_session_state(social_profile)
+    except (KeyError, ValueError):
+        logger.error("A KeyError was encountered while setting up a socialregistration account. Session was: %s", request.session)
         return render_to_response(
             template, dict(error=True), context_instance=RequestContext(request))
+    social_user = User()
+    network = _network_names.get(social_profile.__class__)
 
     # The following associates the correct existing user if they have logged
     # in via a different site on the same database. It allows them to skip the
@@ -112,15 +135,16 @@ def setup(request, template='socialregistration/setup.html',
     # therefore they have a password-less user that would be impossible to
     # associate using the ClaimForm.
     profile_model = social_profile.__class__
-    existing_profiles = profile_model.objects.filter(**{profile_model.remote_id_field: social_profile.remote_id})
-    logger.debug("Found %s existing profiles with criteria %s = %s" % (existing_profiles.count, profile_model.remote_id_field, social_profile.remote_id))
+    existing_profiles = profile_model.objects.filter(profile_model.remote_id_lookup(social_profile.remote_id))
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Found %s existing profiles with criteria %s = %s", existing_profiles.count(), profile_model.remote_id_field, social_profile.remote_id)
     if existing_profiles:
-        logger.info("Found a matching profile, will link profile %s to the same content object as %s" % (social_profile.pk, existing_profiles[0].pk))
+        logger.info("Found a matching profile, will link profile %s to the same content object as %s", social_profile.pk, existing_profiles[0].pk)
         existing_profile = existing_profiles[0]
         social_profile.content_object = existing_profile.content_object
         social_profile.save()
         logger.info("Linked. Redirecting the request.")
-        return _authenticate_login_redirect(request)
+        return _authenticate_login_redirect(request, social_profile)
 
     if not GENERATE_USERNAME:
         # User can pick own username
@@ -128,29 +152,33 @@ def setup(request, template='socialregistration/setup.html',
             logger.debug("Setting up a new profile, username not provided yet.")
             form = form_class(social_user, social_profile,)
         else:
-            logger.debug("Setting up a new social network profile, provided form data: %s" % request.POST)
+            if logger.isEnabledFor(logging.DEBUG):
+                # the claim form posts the password of the existing account
+                logger.debug("Setting up a new social network profile, provided form data: %s",
+                    dict((key, value) for key, value in request.POST.items() if key != 'password'))
             form = form_class(social_user, social_profile, request.POST)
             try:
                 if form.is_valid():
-                    form.save()
-                    user = form.profile.authenticate()
-                    user.set_unusable_password() # we want something there, but it doesn't need to be anything they can actually use - otherwise a password must be assigned manually before the user can be banned or any other administrative action can be taken
-                    user.save()
-                    return _authenticate_login_redirect(request)
+                    with timed('create_user', network):
+                        form.save()
+                        user = form.profile.authenticate()
+                        user.set_unusable_password() # we want something there, but it doesn't need to be anything they can actually use - otherwise a password must be assigned manually before the user can be banned or any other administrative action can be taken
+                        user.save()
+                    return _authenticate_login_redirect(request, social_profile)
 
             except ExistingUser:
                 logger.debug("The user's requested username exists already.")
                 # see what the error is. if it's just an existing user, we want to let them claim it.
                 if 'submitted' in request.POST:
                     form = claim_form_class(
-                        request.session['socialregistration_user'],
-                        request.session['socialregistration_profile'],
+                        social_user,
+                        social_profile,
                         request.POST
                     )
                 else:
                     form = claim_form_class(
-                        request.session['socialregistration_user'],
-                        request.session['socialregistration_profile'],
+                        social_user,
+                        social_profile,
                         initial=request.POST
                     )
 
@@ -158,7 +186,7 @@ def setup(request, template='socialregistration/setup.html',
                     logger.debug("The existing user successfully authenticated and their social network credentials are being extended to their existing user account.")
                     form.save()
 
-                    return _authenticate_login_redirect(request)
+                    return _authenticate_login_redirect(request, social_profile)
 
                 extra_context['claim_account'] = True
 
@@ -169,17 +197,18 @@ def setup(request, template='socialregistration/setup.html',
 
     else:
         # Generate user and profile
-        social_user.username = str(uuid.uuid4())[:30]
-        social_user.save()
-        social_user.set_unusable_password() # we want something there, but it doesn't need to be anything they can actually use - otherwise a password must be assigned manually before the user can be banned or any other administrative action can be taken
-        social_user.save()
+        with timed('create_user', network):
+            social_user.username = str(uuid.uuid4())[:30]
+            social_user.save()
+            social_user.set_unusable_password() # we want something there, but it doesn't need to be anything they can actually use - otherwise a password must be assigned manually before the user can be banned or any other administrative action can be taken
+            social_user.save()
 
-        social_profile.content_object = social_user
-        social_profile.save()
+            social_profile.content_object = social_user
+            social_profile.save()
 
-        logger.debug("Username was autogenerated as %s; unusable password set and account connected." % social_user.username)
+        logger.debug("Username was autogenerated as %s; unusable password set and account connected.", social_user.username)
 
-        return _authenticate_login_redirect(request)
+        return _authenticate_login_redirect(request, social_profile)
 
 if has_csrf:
     setup = csrf_protect(setup)
@@ -198,14 +227,14 @@ def facebook_login(request, template='socialregistration/facebook.html',
     user = authenticate(uid=request.facebook.uid)
 
     if user is None:
-        logger.info("Unable to find a user match for Facebook UID %s, redirecting to have them set up an account." % request.facebook.uid)
-        request.session['socialregistration_user'] = User()
-        request.session['socialregistration_profile'] = FacebookProfile(uid=request.facebook.uid)
-        request.session['next'] = _get_next(request)
+        logger.info("Unable to find a user match for Facebook UID %s, redirecting to have them set up an account.", request.facebook.uid)
+        request.session['socialregistration_profile'] = FacebookProfile(uid=request.facebook.uid).to_session_state()
+        if 'next' not in request.session:
+            request.session['next'] = _get_next(request)
         return HttpResponseRedirect(reverse('socialregistration_setup'))
 
     if not user.is_active:
-        logger.info("Found a match for the user's Facebook UID (%s), but the account is inactive. Alerting the user of this." % request.facebook.uid)
+        logger.info("Found a match for the user's Facebook UID (%s), but the account is inactive. Alerting the user of this.", request.facebook.uid)
         return render_to_response(account_inactive_template, extra_context,
             context_instance=RequestContext(request))
 
@@ -220,7 +249,7 @@ def facebook_connect(request, template='socialregistration/facebook.html',
     """
     # for facebook the login is done in JS, so by the time it hits our view here there is no redirect step. Look for the querystring values and use that instead of worrying about session.
     connect_object = get_object(request.GET)
-    logger.debug("The object to be connected to is %s" % connect_object)
+    logger.debug("The object to be connected to is %s", connect_object)
 
     if getattr(request.facebook, 'user', False): # only go this far if the user authorized our application and there is user info
         if connect_object:
@@ -233,16 +262,16 @@ def facebook_connect(request, template='socialregistration/facebook.html',
                 profile.consumer_key = request.facebook.user.get('access_token')
                 profile.secret = request.facebook.user.get('secret', '')
                 profile.save()
-                logger.info("Found and updated consumer key (%s) / secret (%s) for Facebook Profile of object %s" % (request.facebook.user.get('access_token'), request.facebook.user.get('secret', ''), connect_object))
+                logger.info("Found and updated consumer key (%s) / secret (%s) for Facebook Profile of object %s", request.facebook.user.get('access_token'), request.facebook.user.get('secret', ''), connect_object)
             except FacebookProfile.DoesNotExist:
-                logger.info("No Facebook Profile found. Creating Facebook Profile for %s. Facebook UID is %s, access token %s" % (connect_object, request.facebook.uid, request.facebook.user.get('access_token')))
+                logger.info("No Facebook Profile found. Creating Facebook Profile for %s. Facebook UID is %s, access token %s", connect_object, request.facebook.uid, request.facebook.user.get('access_token'))
                 FacebookProfile.objects.create(content_object=connect_object, uid=request.facebook.uid, \
                     consumer_key=request.facebook.user.get('access_token'), consumer_secret=request.facebook.user.get('secret', ''))
         else:
             logger.debug("No connect object was specified, so we're linking to the currently logged in user.")
             if request.facebook.uid is None or request.user.is_authenticated() is False:
                 extra_context.update(dict(error=FB_ERROR))
-                logger.info("Returned Facebook UID %s, user auth status %s" % (request.facebook.uid, request.user.is_authenticated()))
+                logger.info("Returned Facebook UID %s, user auth status %s", request.facebook.uid, request.user.is_authenticated())
                 logger.info("Facebook Error occurred, alerting the user.")
                 return render_to_response(template, extra_context,
                     context_instance=RequestContext(request))
@@ -252,9 +281,9 @@ def facebook_connect(request, template='socialregistration/facebook.html',
                 profile.consumer_key = request.facebook.user.get('access_token')
                 profile.secret = request.facebook.user.get('secret', '')
                 profile.save()
-                logger.info("Found and updated consumer key (%s) / secret (%s) for Facebook Profile of user %s" % (request.facebook.user.get('access_token'), request.facebook.user.get('secret', ''), request.user))
+                logger.info("Found and updated consumer key (%s) / secret (%s) for Facebook Profile of user %s", request.facebook.user.get('access_token'), request.facebook.user.get('secret', ''), request.user)
             except FacebookProfile.DoesNotExist:
-                logger.info("No Facebook Profile found. Creating Facebook Profile for %s. Facebook UID is %s, access token %s" % (connect_object, request.facebook.uid, request.facebook.user.get('access_token')))
+                logger.info("No Facebook Profile found. Creating Facebook Profile for %s. Facebook UID is %s, access token %s", connect_object, request.facebook.uid, request.facebook.user.get('access_token'))
                 profile = FacebookProfile.objects.create(content_object=request.user, uid=request.facebook.uid, consumer_key=request.facebook.user.get('access_token'), consumer_secret=request.facebook.user.get('secret', ''))
     else:
         logger.info("The user did not authorize connecting Facebook.")
@@ -263,11 +292,12 @@ def facebook_connect(request, template='socialregistration/facebook.html',
             redirect = request.META['HTTP_REFERER']  # send them where they came from
         except KeyError:
             redirect = _get_next(request)  # and fall back to what the view would use otherwise
-        logger.info("Redirecting the user to %s after they didn't authorize Facebook connections." % redirect)
+        logger.info("Redirecting the user to %s after they didn't authorize Facebook connections.", redirect)
         return HttpResponseRedirect(redirect)
 
-    logger.info("Falling back on a redirection to %s" % _get_next(request))
-    return HttpResponseRedirect(_get_next(request))
+    next_url = _get_next(request)
+    logger.info("Falling back on a redirection to %s", next_url)
+    return HttpResponseRedirect(next_url)
 
 def logout(request, redirect_url=None):
     """
@@ -276,16 +306,16 @@ def logout(request, redirect_url=None):
     should be done like described in the developer wiki on facebook.
     http://wiki.developers.facebook.com/index.php/Connect/Authorization_Websites#Logging_Out_Users
     """
-    logger.info("User %s requested to be logged out." % request.user)
+    logger.info("User %s requested to be logged out.", request.user)
     auth_logout(request)
 
     url = redirect_url or getattr(settings, 'LOGOUT_REDIRECT_URL', '/')
-    logger.debug("Requesting now-logged-out user to %s" % url)
+    logger.debug("Requesting now-logged-out user to %s", url)
 
     return HttpResponseRedirect(url)
 
 def twitter(request, account_inactive_template='socialregistration/account_inactive.html',
-    extra_context=dict()):
+    extra_context=None, template='socialregistration/oauthcallback.html'):
     """
     Actually setup/login an account relating to a twitter user after the oauth
     process is finished successfully
@@ -297,8 +327,16 @@ def twitter(request, account_inactive_template='socialregistration/account_inact
         settings.TWITTER_REQUEST_TOKEN_URL,
     )
 
-    user_info = client.get_user_info()
-    logger.debug("User info known about user from Twitter: %s" % user_info)
+    try:
+        user_info = client.get_user_info()
+    except OAuthError, e:
+        logger.info("Could not get user info from Twitter, rendering callback template.")
+        client.errors.append(e.args[0])
+        return render_to_response(
+            template, dict(extra_context or {}, oauth_client=client),
+            context_instance=RequestContext(request)
+        )
+    logger.debug("User info known about user from Twitter: %s", user_info)
 
     try:
         oauth_token = request.session['oauth_api.twitter.com_access_token']['oauth_token']
@@ -315,21 +353,22 @@ def twitter(request, account_inactive_template='socialregistration/account_inact
         except:
             oauth_token_secret = ''
 
-    logger.debug("Received token: %s / Secret: %s" % (oauth_token, oauth_token_secret))
+    logger.debug("Received token: %s / Secret: %s", oauth_token, oauth_token_secret)
 
-    if 'socialregistration_connect_object' in request.session and request.session['socialregistration_connect_object'] != None:
-        logger.debug("Object to be connected to: %s" % request.session['socialregistration_connect_object'])
+    connect_object = _get_connect_object(request)
+    if connect_object is not None:
+        logger.debug("Object to be connected to: %s", connect_object)
         # this exists so that social credentials can be attached to any arbitrary object using the same callbacks.
         # Under normal circumstances it will not be used. Put an object in request.session named 'socialregistration_connect_object' and it will be used instead.
         # After the connection is made it will redirect to request.session value 'socialregistration_connect_redirect' or settings.LOGIN_REDIRECT_URL or /
         try:
             # get the profile for this Twitter ID and type of connected object
-            profile = TwitterProfile.objects.get(twitter_id=user_info['id'], content_type=ContentType.objects.get_for_model(request.session['socialregistration_connect_object'].__class__), object_id=request.session['socialregistration_connect_object'].pk)
-            logger.debug("Found Twitter Profile for %s, Twitter User ID %s" % (request.session['socialregistration_connect_object'], user_info['id']))
+            profile = TwitterProfile.objects.get(twitter_id=user_info['id'], content_type=ContentType.objects.get_for_model(connect_object.__class__), object_id=connect_object.pk)
+            logger.debug("Found Twitter Profile for %s, Twitter User ID %s", connect_object, user_info['id'])
         except TwitterProfile.DoesNotExist:
-            TwitterProfile.objects.create(content_object=request.session['socialregistration_connect_object'], twitter_id=user_info['id'], \
+            TwitterProfile.objects.create(content_object=connect_object, twitter_id=user_info['id'], \
                 screenname=user_info['screen_name'], consumer_key=oauth_token, consumer_secret=oauth_token_secret)
-            logger.debug("Created Twitter Profile for %s, Twitter User ID %s / screen name %s" % (request.session['socialregistration_connect_object'], user_info['id'], user_info['screen_name']))
+            logger.debug("Created Twitter Profile for %s, Twitter User ID %s / screen name %s", connect_object, user_info['id'], user_info['screen_name'])
 
         del request.session['socialregistration_connect_object']
     else:
@@ -341,30 +380,32 @@ def twitter(request, account_inactive_template='socialregistration/account_inact
             except TwitterProfile.DoesNotExist:  # There can only be one profile!
                 profile = TwitterProfile.objects.create(content_object=request.user, twitter_id=user_info['id'], screenname=user_info['screen_name'], consumer_key=oauth_token, consumer_secret=oauth_token_secret)
 
-            logger.debug("Redirecting user to %s after matching up a Twitter Profile." % _get_next(request))
-            return HttpResponseRedirect(_get_next(request))
+            next_url = _get_next(request)
+            logger.debug("Redirecting user to %s after matching up a Twitter Profile.", next_url)
+            return HttpResponseRedirect(next_url)
 
         user = authenticate(twitter_id=user_info['id'])
 
         if user is None:
-            request.session['socialregistration_profile'] = TwitterProfile(twitter_id=user_info['id'], screenname=user_info['screen_name'], consumer_key=oauth_token, consumer_secret=oauth_token_secret)
-            request.session['socialregistration_user'] = User()
-            request.session['next'] = _get_next(request)
-            logger.info("No user found / authentication failed for Twitter ID %s, sending to %s to login, will send to %s after login." % (user_info['id'], reverse('socialregistration_setup'), request.session['next']))
-            return HttpResponseRedirect(reverse('socialregistration_setup'))
+            request.session['socialregistration_profile'] = TwitterProfile(twitter_id=user_info['id'], screenname=user_info['screen_name'], consumer_key=oauth_token, consumer_secret=oauth_token_secret).to_session_state()
+            if 'next' not in request.session:
+                request.session['next'] = _get_next(request)
+            setup_url = reverse('socialregistration_setup')
+            logger.info("No user found / authentication failed for Twitter ID %s, sending to %s to login, will send to %s after login.", user_info['id'], setup_url, request.session['next'])
+            return HttpResponseRedirect(setup_url)
 
         if not user.is_active:
             logger.info("The user logging in is marked inactive. Alerting them to this.")
             return render_to_response(
                 account_inactive_template,
-                extra_context,
+                extra_context or {},
                 context_instance=RequestContext(request)
             )
 
         login(request, user)
 
     next_url = _get_next(request)  # IF the next url is coming from session, the method removes it and makes the next call default to the profile view. So the log reads right, but the user goes to the wrong place.
-    logger.info("Falling back, redirecting user to %s" % next_url)
+    logger.info("Falling back, redirecting user to %s", next_url)
     return HttpResponseRedirect(next_url)
 
 def get_object(info):
@@ -373,19 +414,54 @@ def get_object(info):
         return model.objects.get(pk=info['i'])
     return None
 
+def get_object_reference(info):
+    """
+    Returns a JSON serializable reference to the object ``get_object`` would
+    load, to keep in the session until the provider redirects back. Like
+    ``get_object`` it raises ``DoesNotExist`` for objects that don't exist,
+    before the user is sent to the provider.
+    """
+    if 'a' in info and 'm' in info:
+        content_type = ContentType.objects.get_by_natural_key(app_label=info['a'], model=info['m'])
+        obj = content_type.get_object_for_this_type(pk=info['i'])
+        return {'v': SESSION_STATE_VERSION, 'ct': content_type.pk, 'pk': obj.pk}
+    return None
+
+def _get_connect_object(request):
+    """
+    Returns the object the social account is being connected to, if any.
+    """
+    reference = request.session.get('socialregistration_connect_object')
+    if reference is None or isinstance(reference, models.Model):
+        # objects put into the session directly are used as they are
+        return reference
+    if reference.get('v') != SESSION_STATE_VERSION:
+        return None
+    return ContentType.objects.get_for_id(reference['ct']).get_object_for_this_type(pk=reference['pk'])
+
 def oauth_redirect(request, consumer_key=None, secret_key=None,
     request_token_url=None, access_token_url=None, authorization_url=None,
-    callback_url=None, parameters=None):
+    callback_url=None, parameters=None, template='socialregistration/oauthcallback.html',
+    extra_context=None):
     """
     View to handle the OAuth based authentication redirect to the service provider
     """
-    request.session['socialregistration_connect_object'] = get_object(request.GET)
+    _set_session_value(request, 'socialregistration_connect_object', get_object_reference(request.GET))
 
-    request.session['next'] = _get_next(request)
+    if 'next' not in request.session:
+        request.session['next'] = _get_next(request)
     client = OAuthClient(request, consumer_key, secret_key,
         request_token_url, access_token_url, authorization_url, callback_url, parameters)
     logger.debug("Processing oAuth redirect.")
-    return client.get_redirect()
+    try:
+        return client.get_redirect()
+    except OAuthError, e:
+        logger.info("Could not get a request token, rendering callback template.")
+        client.errors.append(e.args[0])
+        return render_to_response(
+            template, dict(extra_context or {}, oauth_client=client),
+            context_instance=RequestContext(request)
+        )
 
 def oauth_callback(request, consumer_key=None, secret_key=None,
     request_token_url=None, access_token_url=None, authorization_url=None,
@@ -406,7 +482,7 @@ def oauth_callback(request, consumer_key=None, secret_key=None,
             redirect = request.META['HTTP_REFERER']  # send them where they came from
         except KeyError:
             redirect = _get_next(request)  # and fall back to what the view would use otherwise
-        logger.debug("Redirecting user to %s" % redirect)
+        logger.debug("Redirecting user to %s", redirect)
         return HttpResponseRedirect(redirect)
 
     extra_context.update(dict(oauth_client=client))
@@ -418,16 +494,18 @@ def oauth_callback(request, consumer_key=None, secret_key=None,
         )
 
     # We're redirecting to the setup view for this oauth service
-    logger.info("Everything looks good, sending user to the setup view at %s" % reverse(client.callback_url))
-    return HttpResponseRedirect(reverse(client.callback_url))
+    callback_url = reverse(client.callback_url)
+    logger.info("Everything looks good, sending user to the setup view at %s", callback_url)
+    return HttpResponseRedirect(callback_url)
 
 def openid_redirect(request):
     """
     Redirect the user to the openid provider
     """
-    request.session['next'] = _get_next(request)
-    request.session['openid_provider'] = request.GET.get('openid_provider')
-    request.session['socialregistration_connect_object'] = get_object(request.GET)
+    if 'next' not in request.session:
+        request.session['next'] = _get_next(request)
+    _set_session_value(request, 'openid_provider', request.GET.get('openid_provider'))
+    _set_session_value(request, 'socialregistration_connect_object', get_object_reference(request.GET))
 
     client = OpenID(
         request,
@@ -439,12 +517,13 @@ def openid_redirect(request):
         request.GET.get('openid_provider')
     )
     try:
-        logger.info("Received redirect to %s from OpenID" % client.get_redirect())
-        return client.get_redirect()
+        redirect = client.get_redirect()
     except DiscoveryFailure:
         request.session['openid_error'] = True
         logger.info("OpenID failure, sending user to login.")
         return HttpResponseRedirect(settings.LOGIN_URL)
+    logger.info("Received redirect to %s from OpenID", redirect['Location'])
+    return redirect
 
 def openid_callback(request, template='socialregistration/openid.html',
     extra_context=dict(), account_inactive_template='socialregistration/account_inactive.html'):
@@ -465,39 +544,40 @@ def openid_callback(request, template='socialregistration/openid.html',
         logger.info("OpenID login succeeded.")
         identity = client.result.identity_url
 
-        if 'socialregistration_connect_object' in request.session and request.session['socialregistration_connect_object'] != None:
+        connect_object = _get_connect_object(request)
+        if connect_object is not None:
             # this exists so that social credentials can be attached to any arbitrary object using the same callbacks.
             # Under normal circumstances it will not be used. Put an object in request.session named 'socialregistration_connect_object' and it will be used instead.
             # After the connection is made it will redirect to request.session value 'socialregistration_connect_redirect' or settings.LOGIN_REDIRECT_URL or /
-            logger.info("Will be connecting these credentials to %s" % request.session['socialregistration_connect_object'])
+            logger.info("Will be connecting these credentials to %s", connect_object)
             try:
                 # get the profile for this facebook UID and type of connected object
-                profile = OpenIDProfile.objects.get(identity=identity, content_type=ContentType.objects.get_for_model(request.session['socialregistration_connect_object'].__class__), object_id=request.session['socialregistration_connect_object'].pk)
+                profile = OpenIDProfile.objects.get(OpenIDProfile.remote_id_lookup(identity), content_type=ContentType.objects.get_for_model(connect_object.__class__), object_id=connect_object.pk)
             except OpenIDProfile.DoesNotExist:
-                OpenIDProfile.objects.create(content_object=request.session['socialregistration_connect_object'], identity=identity)
+                OpenIDProfile.objects.create(content_object=connect_object, identity=identity)
 
             logger.debug("OpenID profile updated for object.")
 
             del request.session['socialregistration_connect_object']
         else:
-            logger.info("Will be connecting these credentials to the currently logged in user, %s" % request.user)
+            logger.info("Will be connecting these credentials to the currently logged in user, %s", request.user)
             if request.user.is_authenticated():
                 # Handling already logged in users just connecting their accounts
                 try:
-                    profile = OpenIDProfile.objects.get(identity=identity, content_type=ContentType.objects.get_for_model(User), site=Site.objects.get_current())
+                    profile = OpenIDProfile.objects.get(OpenIDProfile.remote_id_lookup(identity), content_type=ContentType.objects.get_for_model(User), site=Site.objects.get_current())
                 except OpenIDProfile.DoesNotExist:  # There can only be one profile with the same identity
                     profile = OpenIDProfile.objects.create(content_object=request.user,
                         identity=identity, site=Site.objects.get_current())
 
-                logger.info("Connected OpenID profile, sending them on to %s" % _get_next(request))
-                return HttpResponseRedirect(_get_next(request))
+                next_url = _get_next(request)
+                logger.info("Connected OpenID profile, sending them on to %s", next_url)
+                return HttpResponseRedirect(next_url)
 
             user = authenticate(identity=identity)
             if user is None:
-                request.session['socialregistration_user'] = User()
                 request.session['socialregistration_profile'] = OpenIDProfile(
                     identity=identity
-                )
+                ).to_session_state()
                 logger.info("We don't know who this OpenID user is. Sending them to the setup view.")
                 return HttpResponseRedirect(reverse('socialregistration_setup'))
 
@@ -510,8 +590,9 @@ def openid_callback(request, template='socialregistration/openid.html',
                 )
 
             login(request, user)
-            logger.debug("User has been logged in, sending them to %s." % _get_next(request))
-        return HttpResponseRedirect(_get_next(request))
+        next_url = _get_next(request)
+        logger.debug("Sending the user on to %s.", next_url)
+        return HttpResponseRedirect(next_url)
 
     logger.debug("Falling back to default OpenID template.")
     return render_to_response(
@@ -519,3 +600,25 @@ def openid_callback(request, template='socialregistration/openid.html',
         dict(),
         context_instance=RequestContext(request)
     )
+
+def _setup_network(request, kwargs):
+    state = request.session.get('socialregistration_profile')
+    if isinstance(state, BaseSocialProfile):
+        return _network_names.get(state.__class__, 'social')
+    try:
+        model = ContentType.objects.get_for_id(state['network']).model_class()
+    except (TypeError, KeyError, ContentType.DoesNotExist):
+        return 'social'
+    return _network_names.get(model, 'social')
+
+def _oauth_network(request, kwargs):
+    return get_network(kwargs.get('request_token_url') or '') or 'oauth'
+
+setup = timed_view(setup, 'setup', _setup_network)
+facebook_login = timed_view(facebook_login, 'login', 'facebook')
+facebook_connect = timed_view(facebook_connect, 'connect', 'facebook')
+twitter = timed_view(twitter, 'login', 'twitter')
+oauth_redirect = timed_view(oauth_redirect, 'redirect', _oauth_network)
+oauth_callback = timed_view(oauth_callback, 'callback', _oauth_network)
+openid_redirect = timed_view(openid_redirect, 'redirect', 'openid')
+openid_callback = timed_view(openid_callback, 'callback', 'openid')